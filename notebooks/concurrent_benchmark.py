@@ -0,0 +1,82 @@
+import marimo
+
+__generated_with = "0.19.9"
+app = marimo.App(width="medium")
+
+
+@app.cell
+def _():
+    import functools
+    import operator
+    import time
+    from concurrent.futures import ProcessPoolExecutor
+
+    import marimo as mo
+    from moutils.concurrent import process_map
+
+    return ProcessPoolExecutor, functools, mo, operator, process_map, time
+
+
+@app.cell(hide_code=True)
+def _(mo):
+    mo.md(r"""
+    # Shipping the mapped function once per worker
+
+    `process_map` sends the mapped function to each worker process once, when
+    the pool starts, and afterwards only sends a short token with every task.
+    Passing an already running pool with `pool=` falls back to pickling the
+    function into every task, like `ProcessPoolExecutor.map` does.
+
+    The function below is a `functools.partial` that captures a large payload,
+    so the difference shows up as per-task overhead. The running pool is
+    created outside the timed region, which favours the per-task baseline.
+    """)
+    return
+
+
+@app.cell
+def _(mo):
+    payload_mb = mo.ui.slider(1, 64, value=8, label="Captured payload (MB)")
+    n_tasks = mo.ui.slider(100, 5000, step=100, value=1000, label="Tasks")
+    workers = mo.ui.slider(1, 8, value=4, label="Workers")
+    mo.vstack([payload_mb, n_tasks, workers])
+    return n_tasks, payload_mb, workers
+
+
+@app.cell
+def _(
+    ProcessPoolExecutor,
+    functools,
+    mo,
+    n_tasks,
+    operator,
+    payload_mb,
+    process_map,
+    time,
+    workers,
+):
+    fn = functools.partial(operator.contains, bytes(payload_mb.value * 2**20))
+    items = [0] * n_tasks.value
+
+    def _timed(**kwargs):
+        start = time.perf_counter()
+        process_map(fn, items, max_workers=workers.value, disabled=True, **kwargs)
+        return time.perf_counter() - start
+
+    with ProcessPoolExecutor(max_workers=workers.value) as _pool:
+        per_task = _timed(pool=_pool)
+    once_per_worker = _timed()
+
+    mo.md(f"""
+    | Strategy | Total | Per task |
+    |----------|------:|---------:|
+    | Pickled with every task | {per_task:.2f} s | {per_task / n_tasks.value * 1e6:,.0f} µs |
+    | Shipped once per worker | {once_per_worker:.2f} s | {once_per_worker / n_tasks.value * 1e6:,.0f} µs |
+
+    **Speedup:** {per_task / once_per_worker:.1f}x
+    """)
+    return
+
+
+if __name__ == "__main__":
+    app.run()
@@ -0,0 +1,114 @@
+import marimo
+
+__generated_with = "0.19.9"
+app = marimo.App(width="medium")
+
+
+@app.cell
+def _():
+    import os
+    import statistics
+    import sys
+    import sysconfig
+    import time
+
+    import marimo as mo
+    from moutils.concurrent import gil_enabled, process_map, thread_map
+
+    return (
+        gil_enabled,
+        mo,
+        os,
+        process_map,
+        statistics,
+        sys,
+        sysconfig,
+        thread_map,
+        time,
+    )
+
+
+@app.cell(hide_code=True)
+def _(gil_enabled, mo, sys, sysconfig):
+    _build = (
+        "free-threaded" if sysconfig.get_config_var("Py_GIL_DISABLED") else "default"
+    )
+    mo.md(f"""
+    # Threads vs processes for CPU-bound Python
+
+    With the GIL, only one thread runs Python bytecode at a time, so
+    `thread_map` does not speed up CPU-bound functions and `process_map` is the
+    way to use more cores, at the cost of pickling items and results. On a
+    free-threaded build (3.13t/3.14t) running without the GIL, threads run in
+    parallel and skip the pickling; `cpu_map` and `array_map` then default to
+    threads.
+
+    This notebook is running Python {sys.version.split()[0]} ({_build} build,
+    GIL {"enabled" if gil_enabled() else "disabled"}). Run it on both build
+    types to compare how each backend scales with the number of workers.
+
+    The mapped function is `statistics.pvariance`, which is pure Python.
+    """)
+    return
+
+
+@app.cell
+def _(mo, os):
+    n_tasks = mo.ui.slider(16, 512, step=16, value=128, label="Tasks")
+    task_size = mo.ui.slider(
+        10_000, 200_000, step=10_000, value=50_000, label="Values per task"
+    )
+    max_workers = mo.ui.slider(
+        1, os.cpu_count() or 1, value=os.cpu_count() or 1, label="Max workers"
+    )
+    mo.vstack([n_tasks, task_size, max_workers])
+    return max_workers, n_tasks, task_size
+
+
+@app.cell
+def _(
+    max_workers,
+    mo,
+    n_tasks,
+    process_map,
+    statistics,
+    task_size,
+    thread_map,
+    time,
+):
+    items = [range(task_size.value)] * n_tasks.value
+    worker_counts = sorted({1, *(2**i for i in range(8)), max_workers.value})
+    worker_counts = [n for n in worker_counts if n <= max_workers.value]
+
+    def _timed(map_fn, workers):
+        start = time.perf_counter()
+        map_fn(statistics.pvariance, items, max_workers=workers, disabled=True)
+        return time.perf_counter() - start
+
+    rows = []
+    for _workers in worker_counts:
+        rows.append(
+            {
+                "workers": _workers,
+                "threads": _timed(thread_map, _workers),
+                "processes": _timed(process_map, _workers),
+            }
+        )
+
+    _base = rows[0]
+    mo.md(
+        "| Workers | Threads | Speedup | Processes | Speedup |\n"
+        "|--:|--:|--:|--:|--:|\n"
+        + "\n".join(
+            f"| {row['workers']} "
+            f"| {row['threads']:.2f} s | {_base['threads'] / row['threads']:.1f}x "
+            f"| {row['processes']:.2f} s "
+            f"| {_base['processes'] / row['processes']:.1f}x |"
+            for row in rows
+        )
+    )
+    return
+
+
+if __name__ == "__main__":
+    app.run()
@@ -1,141 +1,3598 @@
+import asyncio
+import atexit
+import hashlib
+import io
+import json
+import mmap
+import multiprocessing
+import os
+import pickle
+import queue
+import statistics
 import sys
-from collections.abc import Callable, Iterable, Sized
+import threading
+import tempfile
+import time
+import traceback
+import types
+import uuid
+import weakref
+from array import array
+from collections import OrderedDict
+from collections.abc import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    Iterator,
+    Mapping,
+    Sequence,
+    Sized,
+)
 from concurrent.futures import (
+    Executor,
+    Future,
+    InvalidStateError,
     ProcessPoolExecutor,
     ThreadPoolExecutor,
+    wait,
+)
+from contextlib import ExitStack, aclosing, closing, contextmanager, nullcontext
+from functools import partial, reduce
+from itertools import islice
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from typing import Any, Literal, NamedTuple, Optional, Type
+
+if sys.version_info >= (3, 14):
+    from concurrent.futures import InterpreterPoolExecutor
+
+
+import marimo as mo
+
+
+# Pools kept warm across calls (and so across marimo cell re-runs), keyed by the
+# arguments they were created with.
+_DEFAULT_IDLE_TIMEOUT = 300.0
+_pools_lock = threading.Lock()
+_pools: dict[tuple, "_ManagedPool"] = {}
+_managed: weakref.WeakKeyDictionary[Executor, "_ManagedPool"] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+class _ManagedPool:
+    def __init__(
+        self,
+        pool_type: Type[Executor],
+        max_workers: Optional[int],
+        initializer: Optional[Callable[..., object]],
+        initargs: tuple,
+        idle_timeout: Optional[float],
+    ):
+        self.key = (pool_type, max_workers, initializer, initargs)
+        self.idle_timeout = idle_timeout
+        self.executor = pool_type(
+            max_workers=max_workers, initializer=initializer, initargs=initargs
+        )
+        self.users = 0
+        self._timer: Optional[threading.Timer] = None
+
+    def acquire(self) -> None:
+        self.users += 1
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def release(self) -> None:
+        self.users -= 1
+        if self.users == 0:
+            self.arm()
+
+    def arm(self) -> None:
+        """(Re)start the idle timer; callers must hold `_pools_lock`."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self.idle_timeout is not None and self.users == 0:
+            self._timer = threading.Timer(self.idle_timeout, self._expire)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _expire(self) -> None:
+        with _pools_lock:
+            if self.users or _pools.get(self.key) is not self:
+                return
+            del _pools[self.key]
+        self.executor.shutdown(wait=False)
+
+    def shutdown(self, wait: bool) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def _managed_pool(
+    pool_type: Type[Executor],
+    max_workers: Optional[int],
+    initializer: Optional[Callable[..., object]],
+    initargs: tuple,
+    idle_timeout: Optional[float],
+) -> _ManagedPool:
+    """Look up or create a registered pool; callers must hold `_pools_lock`."""
+    key = (pool_type, max_workers, initializer, initargs)
+    managed = _pools.get(key)
+    if managed is None:
+        managed = _ManagedPool(
+            pool_type, max_workers, initializer, initargs, idle_timeout
+        )
+        _pools[key] = managed
+        _managed[managed.executor] = managed
+    managed.idle_timeout = idle_timeout
+    return managed
+
+
+def get_pool(
+    pool_type: Type[ThreadPoolExecutor | ProcessPoolExecutor]
+    | Type["InterpreterPoolExecutor"],
+    *,
+    max_workers: Optional[int] = None,
+    initializer: Optional[Callable[..., object]] = None,
+    initargs: tuple[Any, ...] = (),
+    idle_timeout: Optional[float] = _DEFAULT_IDLE_TIMEOUT,
+) -> Executor:
+    """Return a warm pool shared by every caller asking for the same configuration.
+
+    Pools are keyed by executor type, worker count and initializer (`initargs`
+    must be hashable), and are shut down after `idle_timeout` seconds without
+    use (never, if `None`) or when the interpreter exits. Pass the result as
+    `pool=` to `thread_map`, `process_map`, etc. to skip pool start-up on every
+    marimo cell re-run.
+    """
+    with _pools_lock:
+        managed = _managed_pool(
+            pool_type, max_workers, initializer, initargs, idle_timeout
+        )
+        managed.arm()
+        return managed.executor
+
+
+def shutdown_pools(wait: bool = True) -> None:
+    """Shut down every pool created by `get_pool`."""
+    with _pools_lock:
+        managed = list(_pools.values())
+        _pools.clear()
+    for pool in managed:
+        pool.shutdown(wait=wait)
+
+
+atexit.register(shutdown_pools)
+
+
+def _abort(executor: Executor) -> None:
+    """Shut down without waiting: cancel queued tasks and kill worker processes.
+
+    Running thread pool tasks cannot be killed; they are signalled through
+    `cancelled()` instead and finish in the background.
+    """
+    if isinstance(executor, _Supervised):
+        executor = executor.current
+    if isinstance(executor, ProcessPoolExecutor):
+        if sys.version_info >= (3, 14):
+            executor.terminate_workers()
+            return
+        # `shutdown` forgets the worker processes, so look them up first.
+        processes = list((executor._processes or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+    else:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+@contextmanager
+def _owned(executor: Executor) -> Iterator[Executor]:
+    """Shut a pool down on exit: gracefully on success, immediately on error."""
+    try:
+        yield executor
+    except BaseException:
+        _abort(executor)
+        raise
+    executor.shutdown(wait=True)
+
+
+@contextmanager
+def _lease(executor: Executor) -> Iterator[Executor]:
+    """Mark a registered pool busy, replacing it if it has expired since it was handed out."""
+    managed = _managed.get(executor)
+    if managed is None:
+        # Not one of ours: the caller owns its lifetime.
+        yield executor
+        return
+    with _pools_lock:
+        pool_type, max_workers, initializer, initargs = managed.key
+        managed = _managed_pool(
+            pool_type, max_workers, initializer, initargs, managed.idle_timeout
+        )
+        managed.acquire()
+    try:
+        yield managed.executor
+    except BaseException:
+        # Kill a process pool nobody else is using rather than waiting for its
+        # running tasks; a fresh one is created on the next call.
+        with _pools_lock:
+            sole_user = managed.users == 1 and _pools.get(managed.key) is managed
+            if sole_user and isinstance(managed.executor, ProcessPoolExecutor):
+                del _pools[managed.key]
+            else:
+                sole_user = False
+        if sole_user:
+            _abort(managed.executor)
+        raise
+    finally:
+        with _pools_lock:
+            managed.release()
+
+
+class _Supervised(Executor):
+    """A pool created for one map call, for use with `task_timeout` and `speculate`.
+
+    `restart` replaces the pool to kill a hung task. Tasks given up on with
+    `abandon` are killed (or, in a thread pool, left behind) at shutdown instead
+    of being waited for.
+    """
+
+    def __init__(self, factory: Callable[[], Executor]):
+        self.factory = factory
+        self.current = factory()
+        self._max_workers = self.current._max_workers
+        # Threads cannot be killed, so restarting a thread pool only duplicates work.
+        self.restartable = not _is_thread_pool(type(self.current))
+        self.abandoned: list[Future] = []
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future:
+        return self.current.submit(fn, *args, **kwargs)
+
+    def restart(self) -> None:
+        _abort(self.current)
+        self.current = self.factory()
+        self.abandoned.clear()
+
+    def abandon(self, future: Future) -> None:
+        self.abandoned.append(future)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        if wait and not all(future.done() for future in self.abandoned):
+            _abort(self.current)
+        else:
+            self.current.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+
+# Values passed via `broadcast=`, set once per worker by `_init_worker`. Thread pool
+# workers are threads of this process, so this has to be thread-local.
+_worker_state = threading.local()
+# Shared memory segments attached in this worker, kept open for its lifetime.
+_attached: list[SharedMemory] = []
+
+
+def _is_thread_pool(pool_type: Type[Executor]) -> bool:
+    # InterpreterPoolExecutor subclasses ThreadPoolExecutor, but does not share objects.
+    if sys.version_info >= (3, 14) and issubclass(pool_type, InterpreterPoolExecutor):
+        return False
+    return issubclass(pool_type, ThreadPoolExecutor)
+
+
+def gil_enabled() -> bool:
+    """Whether the GIL is enabled; False only on free-threaded Python running without it.
+
+    A free-threaded build re-enables the GIL at runtime when it imports an
+    extension module that does not support running without it, so this is
+    checked on every call.
+    """
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is None or is_gil_enabled()
+
+
+def _cpu_count() -> int:
+    if sys.version_info >= (3, 13):
+        return os.process_cpu_count() or 1
+    return os.cpu_count() or 1
+
+
+def _cpu_pool() -> Type[Executor]:
+    """The executor type for CPU-bound Python code: threads only if they run in parallel."""
+    return ProcessPoolExecutor if gil_enabled() else ThreadPoolExecutor
+
+
+class _SharedArray:
+    """Picklable handle to a NumPy array that lives in shared memory.
+
+    Only the segment name, shape and dtype are pickled, so workers map the
+    parent's buffer instead of receiving a copy of the data.
+    """
+
+    def __init__(self, shape: tuple[int, ...], dtype: Any, writeable: bool = False):
+        import numpy as np
+
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        self.writeable = writeable
+        size = max(int(np.prod(shape)) * self.dtype.itemsize, 1)
+        self._shm = SharedMemory(create=True, size=size)
+        self.name = self._shm.name
+
+    @classmethod
+    def from_array(cls, array: Any, writeable: bool = False) -> "_SharedArray":
+        shared = cls(array.shape, array.dtype, writeable)
+        shared.view()[...] = array
+        return shared
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "shape": self.shape,
+            "dtype": self.dtype,
+            "writeable": self.writeable,
+        }
+
+    def view(self) -> Any:
+        """Parent-side view; drop it before calling `release`."""
+        import numpy as np
+
+        return np.ndarray(self.shape, self.dtype, buffer=self._shm.buf)
+
+    def attach(self) -> Any:
+        import numpy as np
+
+        if sys.version_info >= (3, 13):
+            shm = SharedMemory(name=self.name, track=False)
+        else:
+            shm = SharedMemory(name=self.name)
+        _attached.append(shm)
+        array = np.ndarray(self.shape, self.dtype, buffer=shm.buf)
+        array.flags.writeable = self.writeable
+        return array
+
+    def release(self) -> None:
+        self._shm.close()
+        self._shm.unlink()
+
+
+def _is_shareable_array(value: Any) -> bool:
+    # If NumPy has not been imported, `value` cannot be an ndarray.
+    np = sys.modules.get("numpy")
+    return (
+        np is not None and isinstance(value, np.ndarray) and not value.dtype.hasobject
+    )
+
+
+# Environment variables read by OpenMP and BLAS libraries to size their thread pools.
+_NATIVE_THREAD_VARIABLES = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
 )
-from typing import Optional, Type
+
+
+def _limit_native_threads(n: int) -> None:
+    """Cap the OpenMP and BLAS thread pools of this worker process at `n` threads."""
+    for name in _NATIVE_THREAD_VARIABLES:
+        os.environ[name] = str(n)
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return
+    # Also covers libraries that were loaded before the variables were set,
+    # e.g. inherited through fork.
+    threadpool_limits(limits=n)
+
+
+def _native_threads_per_worker(
+    native_threads: int | Literal["auto"] | None, max_workers: Optional[int]
+) -> Optional[int]:
+    if native_threads == "auto":
+        return max(1, _cpu_count() // (max_workers or _cpu_count()))
+    return native_threads
+
+
+def _forks(pool_type: Type[Executor]) -> bool:
+    return (
+        issubclass(pool_type, ProcessPoolExecutor)
+        and multiprocessing.get_start_method() == "fork"
+    )
+
+
+def _init_worker(
+    state: bytes
+    | tuple[
+        Mapping[str, Any],
+        Mapping[str, Callable[..., Any]],
+        Optional[Callable[..., object]],
+        tuple,
+    ],
+    native_threads: Optional[int] = None,
+) -> None:
+    if native_threads is not None:
+        _limit_native_threads(native_threads)
+    if isinstance(state, bytes):
+        # Unpickled only now, so that libraries imported by `fn` and `broadcast`
+        # see the thread limits set above.
+        state = pickle.loads(state)
+    broadcast, functions, initializer, initargs = state
+    _worker_state.broadcast = {
+        name: value.attach() if isinstance(value, _SharedArray) else value
+        for name, value in broadcast.items()
+    }
+    _worker_state.functions = functions
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def cancelled() -> bool:
+    """Return whether the map running the current task has been interrupted.
+
+    Long-running functions in thread pools, which cannot be killed, can poll
+    this to stop early. Process pool workers are terminated instead.
+    """
+    event = getattr(_worker_state, "cancel_event", None)
+    return event is not None and event.is_set()
+
+
+class _InWorker:
+    """Runs a task with the map's cancellation event visible and the worker marked.
+
+    The mark, "threads" or "processes", lets maps nested in `fn` run inline
+    instead of starting a pool in every worker (see `_runs_inline`). `event` is
+    None in process and interpreter pools, whose workers are terminated rather
+    than signalled.
+    """
+
+    def __init__(self, fn: Callable[..., Any], event: Optional[threading.Event]):
+        self.fn = fn
+        self.event = event
+
+    def __call__(self, *args: Any) -> Any:
+        previous = (
+            getattr(_worker_state, "cancel_event", None),
+            getattr(_worker_state, "in_map", None),
+        )
+        _worker_state.cancel_event = self.event
+        _worker_state.in_map = "threads" if self.event is not None else "processes"
+        try:
+            return self.fn(*args)
+        finally:
+            _worker_state.cancel_event, _worker_state.in_map = previous
+
+
+def _in_worker() -> bool:
+    return getattr(_worker_state, "in_map", None) is not None
+
+
+def _runs_inline(pool: Type[Executor] | Executor) -> bool:
+    """Whether a map on `pool` called from here should run in the calling worker.
+
+    In a process or interpreter worker, every nested map does: a pool per worker
+    would multiply the processes. In a thread pool worker, only nested thread
+    maps do; a nested process map still gets its own pool, since running
+    CPU-bound items inline would serialize them on the GIL.
+    """
+    if isinstance(pool, Executor):
+        return False
+    kind = getattr(_worker_state, "in_map", None)
+    if kind == "threads":
+        return _is_thread_pool(pool)
+    return kind is not None
+
+
+class _Inline(Executor):
+    """Runs each task right away in the calling thread, for maps nested in a worker."""
+
+    _max_workers = 1
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future:
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class _Registered:
+    """Picklable stand-in for a function shipped to each worker by `_init_worker`.
+
+    Tasks then carry only this token instead of a pickled copy of the function
+    and everything its closure or `functools.partial` arguments reference.
+    """
+
+    def __init__(self, token: str):
+        self.token = token
+
+    def __call__(self, *args: Any) -> Any:
+        return _worker_state.functions[self.token](*args)
+
+
+def get_broadcast(name: str) -> Any:
+    """Return the value passed as `broadcast={name: value}` to the running map.
+
+    Call this from inside the mapped function. Values are shipped once per
+    worker rather than with every task; NumPy arrays are shared read-only
+    through `multiprocessing.shared_memory` in process pools.
+    """
+    try:
+        return _worker_state.broadcast[name]
+    except (AttributeError, KeyError):
+        raise KeyError(f"No broadcast value named {name!r} in this worker") from None
+
+
+@contextmanager
+def _executor(
+    pool: Type[Executor] | Executor,
+    fn: Callable[..., Any],
+    max_workers: Optional[int],
+    persistent: bool,
+    initializer: Optional[Callable[..., object]],
+    initargs: tuple,
+    broadcast: Optional[Mapping[str, Any]],
+    supervised: bool = False,
+    native_threads: int | Literal["auto"] | None = None,
+) -> Iterator[tuple[Executor, Callable[..., Any]]]:
+    """Set up the pool for one map call, yielding it with the callable to submit.
+
+    If the map fails or is interrupted, queued tasks are cancelled and pool
+    shutdown does not wait for them. With `supervised`, a pool created here is
+    wrapped in `_Supervised`.
+    """
+    cancel_event = threading.Event()
+    try:
+        with _pool_for_call(
+            pool,
+            fn,
+            max_workers,
+            persistent,
+            initializer,
+            initargs,
+            broadcast,
+            supervised,
+            native_threads,
+        ) as (executor, task_fn):
+            if not isinstance(executor, _Inline):
+                threads = _is_thread_pool(
+                    pool if isinstance(pool, type) else type(pool)
+                )
+                task_fn = _InWorker(task_fn, cancel_event if threads else None)
+            yield executor, task_fn
+    except BaseException:
+        cancel_event.set()
+        raise
+
+
+@contextmanager
+def _pool_for_call(
+    pool: Type[Executor] | Executor,
+    fn: Callable[..., Any],
+    max_workers: Optional[int],
+    persistent: bool,
+    initializer: Optional[Callable[..., object]],
+    initargs: tuple,
+    broadcast: Optional[Mapping[str, Any]],
+    supervised: bool,
+    native_threads: int | Literal["auto"] | None,
+) -> Iterator[tuple[Executor, Callable[..., Any]]]:
+    if _runs_inline(pool):
+        # Already running in a worker of another map: a pool per worker would
+        # multiply the threads or processes, so run the items in this worker.
+        previous = getattr(_worker_state, "broadcast", {})
+        if broadcast:
+            _worker_state.broadcast = dict(broadcast)
+        try:
+            if initializer is not None:
+                initializer(*initargs)
+            yield _Inline(), fn
+        finally:
+            _worker_state.broadcast = previous
+    elif isinstance(pool, Executor):
+        if initializer is not None or broadcast:
+            raise ValueError(
+                "initializer and broadcast cannot be applied to a running pool; "
+                "pass initializer to get_pool() instead"
+            )
+        with _lease(pool) as executor:
+            yield executor, fn
+    elif persistent:
+        if broadcast:
+            raise ValueError(
+                "broadcast cannot be used with persistent=True; "
+                "load shared state in an initializer instead"
+            )
+        with _lease(
+            get_pool(
+                pool,
+                max_workers=max_workers,
+                initializer=initializer,
+                initargs=initargs,
+            )
+        ) as executor:
+            yield executor, fn
+    elif _is_thread_pool(pool) and not broadcast:
+        factory = partial(
+            pool, max_workers=max_workers, initializer=initializer, initargs=initargs
+        )
+        with _owned(_Supervised(factory) if supervised else factory()) as executor:
+            yield executor, fn
+    else:
+        # Worker processes and interpreters receive `fn` and `broadcast` once, via
+        # the initializer, rather than pickled into every task.
+        functions: dict[str, Callable[..., Any]] = {}
+        task_fn: Callable[..., Any] = fn
+        if not _is_thread_pool(pool):
+            task_fn = _Registered(uuid.uuid4().hex)
+            functions[task_fn.token] = fn
+        shared = {}
+        created = []
+        try:
+            for name, value in (broadcast or {}).items():
+                if not _is_thread_pool(pool) and _is_shareable_array(value):
+                    value = _SharedArray.from_array(value)
+                    created.append(value)
+                shared[name] = value
+            state = (shared, functions, initializer, initargs)
+            limit = None
+            if not _is_thread_pool(pool):
+                # Thread pools share this process's native thread pools; leave them.
+                limit = _native_threads_per_worker(native_threads, max_workers)
+                if limit is not None and not _forks(pool):
+                    state = pickle.dumps(state)
+            factory = partial(
+                pool,
+                max_workers=max_workers,
+                initializer=_init_worker,
+                initargs=(state, limit),
+            )
+            with _owned(_Supervised(factory) if supervised else factory()) as executor:
+                yield executor, task_fn
+        finally:
+            for value in created:
+                value.release()
+
+
+class TaskError:
+    """Record of an item whose function call failed, returned with `on_error="collect"`
+    or `"retry"` in place of its result.
+    """
+
+    def __init__(
+        self,
+        index: Optional[int],
+        item: Any,
+        exception: BaseException,
+        traceback: str,
+        attempts: int,
+    ):
+        self.index = index
+        self.item = item
+        self.exception = exception
+        self.traceback = traceback
+        self.attempts = attempts
+
+    def __repr__(self) -> str:
+        return (
+            f"TaskError(index={self.index!r}, exception={self.exception!r}, "
+            f"attempts={self.attempts})"
+        )
+
+    def __reduce__(self) -> tuple:
+        # Errors cross process boundaries; not every exception survives pickling.
+        exception = self.exception
+        try:
+            pickle.loads(pickle.dumps(exception))
+        except Exception:
+            exception = RuntimeError(f"{type(exception).__name__}: {exception}")
+        return (
+            TaskError,
+            (self.index, self.item, exception, self.traceback, self.attempts),
+        )
+
+
+class _Guarded:
+    """Calls `fn`, retrying with exponential backoff and returning failures as `TaskError`."""
+
+    def __init__(
+        self,
+        fn: Callable[..., Any],
+        retries: int,
+        backoff: float,
+        retry_on: tuple[type[Exception], ...],
+        star: bool = False,
+    ):
+        self.fn = fn
+        self.retries = retries
+        self.backoff = backoff
+        self.retry_on = retry_on
+        self.star = star
+
+    def __call__(self, *args: Any) -> Any:
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                return self.fn(*args)
+            except Exception as e:
+                if attempts > self.retries or not isinstance(e, self.retry_on):
+                    item = args if self.star else args[0]
+                    return TaskError(None, item, e, traceback.format_exc(), attempts)
+            time.sleep(self.backoff * 2 ** (attempts - 1))
+
+
+def _guard(
+    fn: Callable[..., Any],
+    on_error: Literal["raise", "collect", "retry"],
+    retries: int,
+    backoff: float,
+    retry_on: tuple[type[Exception], ...],
+    star: bool = False,
+) -> Callable[..., Any]:
+    if on_error == "raise":
+        return fn
+    if on_error == "collect":
+        return _Guarded(fn, 0, backoff, retry_on, star)
+    if on_error == "retry":
+        if retries < 0:
+            raise ValueError("retries must not be negative")
+        return _Guarded(fn, retries, backoff, retry_on, star)
+    raise ValueError("on_error must be 'raise', 'collect' or 'retry'")
+
+
+# Target wall time of one chunk in `chunksize="auto"` mode: long enough to amortize
+# the per-task IPC round trip, short enough to keep the progress bar moving.
+_AUTO_CHUNK_TARGET = 0.1
+_AUTO_CHUNK_MAX = 65536
+# Chunks per worker kept in flight in `chunksize="auto"` mode when `max_in_flight`
+# is not given, so that later chunks are sized from the run times of earlier ones.
+_AUTO_CHUNK_WINDOW = 4
+
+
+def _run_chunk[T, R](
+    fn: Callable[..., R], chunk: list[T], star: bool = False
+) -> tuple[list[R], float]:
+    start = time.perf_counter()
+    if star:
+        results = [fn(*item) for item in chunk]
+    else:
+        results = [fn(item) for item in chunk]
+    return results, time.perf_counter() - start
+
+
+class _ChunkSizer:
+    """Chooses how many items go into the next submitted task."""
+
+    def __init__(self, chunksize: int | Literal["auto"]):
+        self.auto = chunksize == "auto"
+        if self.auto:
+            self.size = 1
+        elif isinstance(chunksize, int) and chunksize >= 1:
+            self.size = chunksize
+        else:
+            raise ValueError("chunksize must be a positive integer or 'auto'")
+        self._per_item: Optional[float] = None
+
+    def observe(self, n: int, elapsed: float) -> None:
+        if not self.auto:
+            return
+        per_item = elapsed / n
+        if self._per_item is None:
+            self._per_item = per_item
+        else:
+            # Exponential moving average, so one noisy chunk does not swing the size.
+            self._per_item = 0.5 * self._per_item + 0.5 * per_item
+        target = _AUTO_CHUNK_TARGET / max(self._per_item, 1e-9)
+        self.size = max(1, min(_AUTO_CHUNK_MAX, int(target)))
+
+
+_DEFAULT_CACHE_SIZE = 1 << 30
+_MISSING = object()
+
+
+class _CanonicalPickler(pickle.Pickler):
+    """Pickles sets and frozensets with their elements in a canonical order.
+
+    Set iteration order follows string hashes, which `PYTHONHASHSEED`
+    randomizes per interpreter, so plain pickles of equal sets differ between
+    kernel restarts. Everything else pickles exactly as with `pickle.dumps`.
+    """
+
+    def persistent_id(self, obj: Any) -> Any:
+        if isinstance(obj, (set, frozenset)):
+            elements = sorted(_stable_dumps(element) for element in obj)
+            return type(obj).__name__, tuple(elements)
+        return None
+
+
+def _stable_dumps(obj: Any) -> bytes:
+    """`pickle.dumps(obj)`, but equal across interpreter runs for hashing."""
+    buffer = io.BytesIO()
+    _CanonicalPickler(buffer).dump(obj)
+    return buffer.getvalue()
+
+
+def _fingerprint(fn: Callable[..., Any]) -> bytes:
+    """Hash what determines `fn`'s output: its code, closure, defaults and bound args.
+
+    Changes to other functions that `fn` looks up as globals are not detected.
+    """
+    digest = hashlib.sha256()
+
+    def code(obj: types.CodeType) -> None:
+        digest.update(obj.co_code)
+        digest.update(repr(obj.co_names).encode())
+        for const in obj.co_consts:
+            if isinstance(const, types.CodeType):
+                code(const)
+            elif isinstance(const, (frozenset, tuple)):
+                # `x in {"a", "b"}` compiles to a frozenset, whose repr is unstable.
+                digest.update(_stable_dumps(const))
+            else:
+                digest.update(repr(const).encode())
+
+    def visit(obj: Any) -> None:
+        if isinstance(obj, partial):
+            visit(obj.func)
+            visit(obj.args)
+            visit(obj.keywords)
+        elif isinstance(obj, types.MethodType):
+            visit(obj.__func__)
+            visit(obj.__self__)
+        elif isinstance(obj, types.FunctionType):
+            digest.update(f"{obj.__module__}.{obj.__qualname__}".encode())
+            code(obj.__code__)
+            for cell in obj.__closure__ or ():
+                visit(cell.cell_contents)
+            visit(obj.__defaults__)
+            visit(obj.__kwdefaults__)
+        else:
+            try:
+                digest.update(_stable_dumps(obj))
+            except Exception as e:
+                raise TypeError(
+                    f"cache= requires picklable closures and arguments; "
+                    f"cannot hash {type(obj).__name__}"
+                ) from e
+
+    visit(fn)
+    return digest.digest()
+
+
+def _item_key(fingerprint: bytes, item: Any) -> str:
+    digest = hashlib.sha256(fingerprint)
+    digest.update(_stable_dumps(item))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """On-disk, content-addressed store for per-item results of the map helpers.
+
+    Entries are keyed by a hash of the mapped function (code, closure, defaults)
+    and the pickled input item, so re-running a cell only computes items that
+    are new or whose function changed. Once the directory grows past
+    `max_size` bytes, the least recently used entries are evicted.
+    """
+
+    def __init__(
+        self,
+        directory: str | os.PathLike[str] | None = None,
+        max_size: int = _DEFAULT_CACHE_SIZE,
+    ):
+        if directory is None:
+            base = os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")
+            directory = Path(base) / "moutils" / "concurrent"
+        self.directory = Path(directory)
+        self.max_size = max_size
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.pkl"
+
+    def get(self, key: str) -> Any:
+        """Return the cached result, or `_MISSING`."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return _MISSING
+        # The modification time doubles as the last-used time for eviction.
+        os.utime(path)
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so readers never see a partial entry.
+        with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as f:
+            pickle.dump(value, f)
+        os.replace(f.name, path)
+
+    def evict(self) -> None:
+        """Delete least recently used entries until the cache fits in `max_size`."""
+        entries = []
+        for path in self.directory.glob("*/*.pkl"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            size -= entry_size
+
+    def clear(self) -> None:
+        for path in self.directory.glob("*/*.pkl"):
+            path.unlink(missing_ok=True)
+
+
+def _resolve_cache(
+    cache: ResultCache | str | os.PathLike[str] | bool | None,
+) -> Optional[ResultCache]:
+    if cache is None or cache is False:
+        return None
+    if cache is True:
+        return ResultCache()
+    if isinstance(cache, ResultCache):
+        return cache
+    return ResultCache(cache)
+
+
+class _Journal:
+    """Append-only file of `(index, key, result)` records backing `checkpoint=`.
+
+    Records are flushed as soon as each result arrives, so they survive an
+    interrupt or a kernel restart. A later run over the same inputs reuses a
+    record only if the item's key (function fingerprint and item) still matches.
+    """
+
+    def __init__(self, path: str | os.PathLike[str]):
+        self.path = Path(path)
+        self.done: dict[int, tuple[str, Any]] = {}
+        valid = 0
+        if self.path.exists():
+            with open(self.path, "rb") as f:
+                while True:
+                    try:
+                        index, key, result = pickle.load(f)
+                    except Exception:
+                        # End of file, or a record torn by a crash mid-write.
+                        break
+                    self.done[index] = (key, result)
+                    valid = f.tell()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "ab")
+        self._file.truncate(valid)
+
+    def get(self, index: int, key: str) -> Any:
+        """Return the recorded result for `index`, or `_MISSING`."""
+        entry = self.done.pop(index, None)
+        if entry is None or entry[0] != key:
+            return _MISSING
+        return entry[1]
+
+    def append(self, index: int, key: str, result: Any) -> None:
+        pickle.dump((index, key, result), self._file)
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class SpilledResults(Sequence):
+    """Results of a map with `spill_after=`, kept on disk once they outgrow memory.
+
+    Results are held in memory until their pickled size reaches `spill_after`
+    bytes; later ones are appended as pickle frames to a temporary file and
+    read back through `mmap` when indexed or iterated. Supports `len`,
+    indexing, slicing (which returns a list) and iteration like the list a map
+    normally returns. `close()` deletes the file.
+    """
+
+    def __init__(
+        self, spill_after: int, directory: str | os.PathLike[str] | None = None
+    ):
+        if spill_after < 0:
+            raise ValueError("spill_after must not be negative")
+        self.spill_after = spill_after
+        self.directory = directory
+        self._memory: list[Any] = []
+        self._memory_bytes = 0
+        # Start of each spilled frame in the file; the last one ends at `_end`.
+        self._offsets = array("Q")
+        self._end = 0
+        self._file = None
+        self._mmap: Optional[mmap.mmap] = None
+
+    @property
+    def spilled(self) -> int:
+        """Number of results stored on disk."""
+        return len(self._offsets)
+
+    def append(self, result: Any) -> None:
+        data = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+        if self._file is None:
+            if self._memory_bytes + len(data) <= self.spill_after:
+                self._memory.append(result)
+                self._memory_bytes += len(data)
+                return
+            self._file = tempfile.TemporaryFile(
+                prefix="moutils-spill-", dir=self.directory
+            )
+        self._offsets.append(self._end)
+        self._file.write(data)
+        self._end += len(data)
+
+    def extend(self, results: Iterable[Any]) -> None:
+        for result in results:
+            self.append(result)
+
+    def _load(self, i: int) -> Any:
+        if self._mmap is None or len(self._mmap) < self._end:
+            # Map the file again to take in frames appended since the last read.
+            self._file.flush()
+            if self._mmap is not None:
+                self._mmap.close()
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        stop = self._offsets[i + 1] if i + 1 < len(self._offsets) else self._end
+        return pickle.loads(self._mmap[self._offsets[i] : stop])
+
+    def __len__(self) -> int:
+        return len(self._memory) + len(self._offsets)
+
+    def __getitem__(self, index: int | slice) -> Any:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        n = len(self)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("SpilledResults index out of range")
+        if index < len(self._memory):
+            return self._memory[index]
+        return self._load(index - len(self._memory))
+
+    def __iter__(self) -> Iterator[Any]:
+        yield from self._memory
+        for i in range(len(self._offsets)):
+            yield self._load(i)
+
+    def __repr__(self) -> str:
+        return f"SpilledResults({len(self):,} results, {self.spilled:,} on disk)"
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._memory.clear()
+        self._offsets = array("Q")
+        self._end = 0
+
+    def __enter__(self) -> "SpilledResults":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+class TaskStats(NamedTuple):
+    """Timings of one item. Times are `time.time()` seconds, taken in the worker."""
+
+    index: int
+    submitted: float
+    started: float
+    finished: float
+    # (process id, thread id) of the worker that ran the item.
+    worker: tuple[int, int]
+    # Size of the pickled result, in process and interpreter pools only.
+    result_bytes: Optional[int]
+
+    @property
+    def queue_wait(self) -> float:
+        return self.started - self.submitted
+
+    @property
+    def run_time(self) -> float:
+        return self.finished - self.started
+
+
+class MapStats:
+    """Execution statistics of a map call, filled in when passed as `stats=`.
+
+    Each computed item gets a `TaskStats` record; `summary()` reduces them to
+    throughput, latency percentiles and worker utilization, and
+    `to_chrome_trace(path)` writes a trace that chrome://tracing and Perfetto
+    (ui.perfetto.dev) can open, with one row per worker.
+
+    With `chunksize` above 1, the queue wait of an item includes the run time of
+    the items before it in its chunk.
+    """
+
+    def __init__(self):
+        self.tasks: list[TaskStats] = []
+        self.cached = 0
+        self.workers: Optional[int] = None
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    def summary(self) -> dict[str, Any]:
+        wall_time = (self.finished or 0.0) - (self.started or 0.0)
+        run_times = [task.run_time for task in self.tasks]
+        waits = [task.queue_wait for task in self.tasks]
+        workers = self.workers or len({task.worker for task in self.tasks}) or 1
+        sizes = [
+            task.result_bytes for task in self.tasks if task.result_bytes is not None
+        ]
+        return {
+            "items": len(self.tasks) + self.cached,
+            "cached": self.cached,
+            "wall_time": wall_time,
+            "throughput": (len(self.tasks) + self.cached) / wall_time
+            if wall_time > 0
+            else 0.0,
+            "run_time": _percentiles(run_times),
+            "queue_wait": _percentiles(waits),
+            "utilization": sum(run_times) / (wall_time * workers)
+            if wall_time > 0
+            else 0.0,
+            "result_bytes": sum(sizes) if sizes else None,
+        }
+
+    def to_chrome_trace(self, path: str | os.PathLike[str]) -> None:
+        origin = self.started or 0.0
+        events = []
+        for task in self.tasks:
+            pid, tid = task.worker
+            events.append(
+                {
+                    "name": f"item {task.index}",
+                    "ph": "X",
+                    "ts": (task.started - origin) * 1e6,
+                    "dur": task.run_time * 1e6,
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {
+                        "index": task.index,
+                        "queue_wait_ms": task.queue_wait * 1e3,
+                        "result_bytes": task.result_bytes,
+                    },
+                }
+            )
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def _display_(self) -> Any:
+        summary = self.summary()
+        run_time = summary["run_time"]
+        queue_wait = summary["queue_wait"]
+        rows = "\n".join(
+            f"| {name} | {values['p50'] * 1e3:,.2f} ms | {values['p95'] * 1e3:,.2f} ms "
+            f"| {values['p99'] * 1e3:,.2f} ms |"
+            for name, values in [("Run time", run_time), ("Queue wait", queue_wait)]
+        )
+        return mo.md(
+            f"**{summary['items']:,} items** in {summary['wall_time']:.2f} s "
+            f"({summary['throughput']:,.0f} items/s, "
+            f"{summary['utilization']:.0%} worker utilization)\n\n"
+            f"| | p50 | p95 | p99 |\n|---|--:|--:|--:|\n{rows}"
+        )
+
+
+def _percentiles(values: list[float]) -> dict[str, float]:
+    if len(values) < 2:
+        value = values[0] if values else 0.0
+        return {"p50": value, "p95": value, "p99": value}
+    q = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": q[49], "p95": q[94], "p99": q[98]}
+
+
+class _Timed:
+    """Calls `fn`, returning its result with when and where it ran for `MapStats`."""
+
+    def __init__(self, fn: Callable[..., Any], measure_size: bool):
+        self.fn = fn
+        self.measure_size = measure_size
+
+    def __call__(self, *args: Any) -> tuple[Any, float, float, tuple[int, int], Any]:
+        started = time.time()
+        result = self.fn(*args)
+        finished = time.time()
+        size = None
+        if self.measure_size:
+            size = len(pickle.dumps(result, pickle.HIGHEST_PROTOCOL))
+        return (
+            result,
+            started,
+            finished,
+            (os.getpid(), threading.get_native_id()),
+            size,
+        )
+
+
+# How often a supervised map checks for hung tasks and idle workers, in seconds.
+_SUPERVISE_INTERVAL = 0.1
+
+
+class _Task(NamedTuple):
+    indices: list[int]
+    # Keys of the items computed by this task, if caching or checkpointing.
+    keys: Optional[list[str]]
+    # "direct": the future holds `fn(item)`; "chunk": `_run_chunk`'s output;
+    # "cached": the list of results, already read from the cache.
+    kind: Literal["direct", "chunk", "cached"]
+    # When supervised, the submitted items and the executor futures running them;
+    # the future in `pending` is then a proxy settled by the first run to finish.
+    items: Optional[list[Any]] = None
+    runs: Optional[list[Future]] = None
+    # When the task was submitted, for `MapStats`.
+    submitted: float = 0.0
+
+
+def _settle(proxy: Future, runs: list[Future], run: Future) -> None:
+    """Resolve `proxy` with the outcome of `run`, unless it was given up on."""
+    if run not in runs or run.cancelled():
+        return
+    try:
+        if run.exception() is not None:
+            proxy.set_exception(run.exception())
+        else:
+            proxy.set_result(run.result())
+    except InvalidStateError:
+        # Another run, or a timeout, got there first.
+        pass
+
+
+class _Scheduler[T, R]:
+    """Submits items to an executor in a bounded window and unpacks finished tasks.
+
+    Items are pulled from `iterable` only as slots free up, so arbitrarily long
+    (or infinite) iterables are mapped in constant memory. Unless `chunksize` is
+    1, items are sent to the pool in chunks to amortize the per-task overhead.
+    Items found in `journal` or `cache` are not submitted at all.
+
+    With `task_timeout` or `speculate`, the scheduler is supervised: `supervise`
+    gives up on tasks that run too long and, once every item has been started,
+    submits copies of the longest-running tasks to idle workers.
+    """
+
+    def __init__(
+        self,
+        executor: Executor,
+        fn: Callable[[T], R],
+        iterable: Iterable[T],
+        *,
+        max_in_flight: Optional[int],
+        chunksize: int | Literal["auto"],
+        cache: Optional[ResultCache] = None,
+        journal: Optional[_Journal] = None,
+        fingerprint: bytes = b"",
+        task_timeout: Optional[float] = None,
+        speculate: bool = False,
+        collect_errors: bool = False,
+        stats: Optional[MapStats] = None,
+        cost: Optional[Callable[..., float]] = None,
+        star: bool = False,
+    ):
+        if max_in_flight is not None and max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        if task_timeout is not None:
+            if task_timeout <= 0:
+                raise ValueError("task_timeout must be positive")
+            if chunksize != 1:
+                raise ValueError("task_timeout requires chunksize=1")
+            if not isinstance(executor, (_Supervised, _Inline)) and not _is_thread_pool(
+                type(executor)
+            ):
+                raise ValueError(
+                    "task_timeout cannot kill tasks in a running or persistent pool; "
+                    "pass the pool type instead"
+                )
+        self.executor = executor
+        self.fn = fn
+        self.stats = stats
+        if stats is not None:
+            pool = executor.current if isinstance(executor, _Supervised) else executor
+            self.fn = _Timed(fn, measure_size=not _is_thread_pool(type(pool)))
+            stats.workers = getattr(executor, "_max_workers", None)
+            stats.started = time.time()
+        self.sizer = _ChunkSizer(chunksize)
+        if max_in_flight is None and self.sizer.auto:
+            # Submitting everything up front would send every item at the
+            # initial size of 1, before any chunk has been measured.
+            workers = getattr(executor, "_max_workers", None) or _cpu_count()
+            max_in_flight = _AUTO_CHUNK_WINDOW * workers
+        self.max_in_flight = max_in_flight
+        self.chunked = chunksize != 1
+        self.star = star
+        self.items = enumerate(iterable)
+        if cost is not None:
+            # Longest processing time first: expensive items start early instead of
+            # being picked up last and finishing long after everything else.
+            self.items = iter(
+                sorted(
+                    self.items,
+                    key=lambda pair: cost(*pair[1]) if star else cost(pair[1]),
+                    reverse=True,
+                )
+            )
+        self.cache = cache
+        self.journal = journal
+        self.keyed = cache is not None or journal is not None
+        self.fingerprint = fingerprint
+        self.task_timeout = task_timeout
+        self.speculate = speculate
+        self.supervised = task_timeout is not None or speculate
+        self.collect_errors = collect_errors
+        self.exhausted = False
+        # An item pulled past the end of the previous chunk, with its key and result.
+        self.lookahead: Optional[tuple[int, T, Optional[str], Any]] = None
+        # Insertion order doubles as submission order for the ordered case.
+        self.pending: OrderedDict[Future, _Task] = OrderedDict()
+        # When each supervised task was first seen running, in that order.
+        self.started: dict[Future, float] = {}
+        # Called with each task's future as it finishes, for completion order.
+        self.on_done: Optional[Callable[[Future], None]] = None
+
+    def _pull(self) -> Optional[tuple[int, T, Optional[str], Any]]:
+        """Next `(index, item, key, result)`, where `result` is `_MISSING` unless cached."""
+        if self.lookahead is not None:
+            pulled, self.lookahead = self.lookahead, None
+            return pulled
+        try:
+            i, item = next(self.items)
+        except StopIteration:
+            self.exhausted = True
+            return None
+        key = None
+        result = _MISSING
+        if self.keyed:
+            key = _item_key(self.fingerprint, item)
+            if self.journal is not None:
+                result = self.journal.get(i, key)
+            if result is _MISSING and self.cache is not None:
+                result = self.cache.get(key)
+        return i, item, key, result
+
+    def _next_chunk(
+        self,
+    ) -> tuple[list[tuple[int, T, Optional[str]]], list[tuple[int, R]]]:
+        """Pull up to one chunk of items that are either all misses or all cache hits.
+
+        A chunk ends where the items switch between the two, so that tasks in
+        `pending` cover consecutive indices in input order.
+        """
+        misses = []
+        hits = []
+        while len(misses) + len(hits) < self.sizer.size:
+            pulled = self._pull()
+            if pulled is None:
+                break
+            i, item, key, result = pulled
+            if (result is _MISSING and hits) or (result is not _MISSING and misses):
+                self.lookahead = pulled
+                break
+            if result is _MISSING:
+                misses.append((i, item, key))
+            else:
+                hits.append((i, result))
+        return misses, hits
+
+    def _has_room(self) -> bool:
+        if self.max_in_flight is not None and len(self.pending) >= self.max_in_flight:
+            return False
+        if self.supervised:
+            # Process pools mark a task running as soon as it enters their call
+            # queue, before a worker picks it up. Submitting no more tasks than
+            # there are workers keeps the `task_timeout` clock to the run itself.
+            workers = getattr(self.executor, "_max_workers", None)
+            if workers is not None:
+                return sum(not proxy.done() for proxy in self.pending) < workers
+        return True
+
+    def fill(self) -> None:
+        while self._has_room():
+            misses, hits = self._next_chunk()
+            if hits:
+                future = Future()
+                future.set_result([result for _, result in hits])
+                self._add(future, _Task([i for i, _ in hits], None, "cached"))
+            if not misses:
+                if not hits:
+                    return
+                continue
+            items = [item for _, item, _ in misses]
+            submitted = time.time()
+            future = self._launch(items)
+            keys = [key for _, _, key in misses] if self.keyed else None
+            task = _Task(
+                [i for i, _, _ in misses],
+                keys,
+                "chunk" if self.chunked else "direct",
+                submitted=submitted,
+            )
+            if self.supervised:
+                task = task._replace(items=items, runs=[future])
+                future = Future()
+                task.runs[0].add_done_callback(partial(_settle, future, task.runs))
+            self._add(future, task)
+
+    def _add(self, future: Future, task: _Task) -> None:
+        self.pending[future] = task
+        if self.on_done is not None:
+            future.add_done_callback(self.on_done)
+
+    def _launch(self, items: list[T]) -> Future:
+        if self.chunked:
+            return self.executor.submit(_run_chunk, self.fn, items, self.star)
+        if self.star:
+            return self.executor.submit(self.fn, *items[0])
+        return self.executor.submit(self.fn, items[0])
+
+    def _rerun(self, proxy: Future, task: _Task) -> None:
+        run = self._launch(task.items)
+        task.runs.append(run)
+        run.add_done_callback(partial(_settle, proxy, task.runs))
+
+    def _drop(self, run: Future) -> None:
+        if (
+            not run.cancel()
+            and not run.done()
+            and isinstance(self.executor, _Supervised)
+        ):
+            self.executor.abandon(run)
+
+    def timeout(self) -> Optional[float]:
+        """How long drivers may block before calling `supervise` again."""
+        return _SUPERVISE_INTERVAL if self.supervised else None
+
+    def supervise(self) -> None:
+        """Time out hung tasks and, once the queue drains, speculate on stragglers."""
+        if not self.supervised:
+            return
+        now = time.monotonic()
+        drained = self.exhausted
+        for proxy, task in self.pending.items():
+            if proxy.done() or task.runs is None or proxy in self.started:
+                continue
+            if not any(run.running() for run in task.runs):
+                # Pools run tasks in submission order, so the rest are queued too.
+                drained = False
+                break
+            self.started[proxy] = now
+        if self.task_timeout is not None:
+            expired = [
+                proxy
+                for proxy, started in self.started.items()
+                if now - started >= self.task_timeout and not proxy.done()
+            ]
+            if expired:
+                self._expire(expired)
+        if self.speculate and drained:
+            self._speculate()
+
+    def _expire(self, expired: list[Future]) -> None:
+        for proxy in expired:
+            task = self.pending[proxy]
+            runs = list(task.runs)
+            task.runs.clear()
+            del self.started[proxy]
+            error = TimeoutError(
+                f"Task did not finish within task_timeout={self.task_timeout}s"
+            )
+            if not self.collect_errors:
+                raise error
+            try:
+                proxy.set_result(
+                    TaskError(
+                        None,
+                        task.items[0],
+                        error,
+                        "".join(traceback.format_exception_only(error)),
+                        1,
+                    )
+                )
+            except InvalidStateError:
+                pass
+            for run in runs:
+                self._drop(run)
+        if isinstance(self.executor, _Supervised) and self.executor.restartable:
+            # Killing the hung workers takes the whole pool down; start the other
+            # unfinished tasks over in a fresh one.
+            restarted = []
+            for proxy, task in self.pending.items():
+                if not proxy.done() and task.runs:
+                    task.runs.clear()
+                    self.started.pop(proxy, None)
+                    restarted.append((proxy, task))
+            self.executor.restart()
+            for proxy, task in restarted:
+                self._rerun(proxy, task)
+
+    def _speculate(self) -> None:
+        workers = getattr(self.executor, "_max_workers", None)
+        if workers is None:
+            return
+        busy = sum(
+            not run.done()
+            for proxy, task in self.pending.items()
+            if not proxy.done() and task.runs
+            for run in task.runs
+        )
+        idle = workers - busy
+        for proxy in self.started:
+            if idle <= 0:
+                return
+            task = self.pending[proxy]
+            if not proxy.done() and len(task.runs) == 1:
+                self._rerun(proxy, task)
+                idle -= 1
+
+    def collect(self, future: Future) -> list[tuple[int, R]]:
+        task = self.pending.pop(future)
+        self.started.pop(future, None)
+        for run in task.runs or ():
+            if not run.done():
+                self._drop(run)
+        if task.kind == "chunk":
+            results, elapsed = future.result()
+            self.sizer.observe(len(task.indices), elapsed)
+        elif task.kind == "direct":
+            results = [future.result()]
+        else:
+            results = future.result()
+        if self.stats is not None:
+            results = self._record(task, results)
+        for index, result in zip(task.indices, results):
+            if isinstance(result, TaskError):
+                result.index = index
+        if task.keys is not None:
+            for index, key, result in zip(task.indices, task.keys, results):
+                # Failures are not remembered, so that the next run retries them.
+                if isinstance(result, TaskError):
+                    continue
+                if self.journal is not None:
+                    self.journal.append(index, key, result)
+                if self.cache is not None:
+                    self.cache.put(key, result)
+        return list(zip(task.indices, results))
+
+    def _record(self, task: _Task, results: list[Any]) -> list[R]:
+        self.stats.finished = time.time()
+        if task.kind == "cached":
+            self.stats.cached += len(results)
+            return results
+        unwrapped = []
+        for index, result in zip(task.indices, results):
+            # Timed-out items are failed by the scheduler and never ran to completion.
+            if not isinstance(result, TaskError):
+                result, started, finished, worker, size = result
+                self.stats.tasks.append(
+                    TaskStats(index, task.submitted, started, finished, worker, size)
+                )
+            unwrapped.append(result)
+        return unwrapped
+
+    def cancel(self) -> None:
+        for future, task in self.pending.items():
+            future.cancel()
+            for run in task.runs or ():
+                run.cancel()
+
+
+def _submit[R](scheduler: _Scheduler[Any, R], ordered: bool) -> Iterator[tuple[int, R]]:
+    """Yield `(index, fn(item))` pairs in input or completion order."""
+    # Finished tasks are queued by their done callbacks, so completion order
+    # costs O(1) per task rather than a `wait` over everything still pending.
+    completions: queue.SimpleQueue[Future] = queue.SimpleQueue()
+    if not ordered:
+        scheduler.on_done = completions.put
+    try:
+        scheduler.fill()
+        while scheduler.pending:
+            timeout = scheduler.timeout()
+            if ordered:
+                head = next(iter(scheduler.pending))
+                if timeout is None:
+                    # `collect` blocks on the result; skip the cost of `wait`.
+                    done = [head]
+                else:
+                    done, _ = wait([head], timeout=timeout)
+            else:
+                try:
+                    done = [completions.get(timeout=timeout)]
+                except queue.Empty:
+                    done = []
+            for future in done:
+                yield from scheduler.collect(future)
+            scheduler.supervise()
+            scheduler.fill()
+    finally:
+        scheduler.cancel()
+
+
+async def _asubmit[R](scheduler: _Scheduler[Any, R]) -> AsyncIterator[tuple[int, R]]:
+    """Like `_submit` in completion order, but awaits instead of blocking the thread."""
+    loop = asyncio.get_running_loop()
+    completions: asyncio.Queue[Future] = asyncio.Queue()
+
+    def on_done(future: Future) -> None:
+        try:
+            loop.call_soon_threadsafe(completions.put_nowait, future)
+        except RuntimeError:
+            # The loop has closed; the map was abandoned before this task ended.
+            pass
+
+    scheduler.on_done = on_done
+    try:
+        scheduler.fill()
+        while scheduler.pending:
+            try:
+                future = await asyncio.wait_for(
+                    completions.get(), timeout=scheduler.timeout()
+                )
+            except asyncio.TimeoutError:
+                pass
+            else:
+                for pair in scheduler.collect(future):
+                    yield pair
+            scheduler.supervise()
+            scheduler.fill()
+    finally:
+        scheduler.cancel()
+
+
+class _WithLength:
+    """An iterator that reports a known length, so the progress bar has a total."""
+
+    def __init__(self, iterator: Iterator[Any], length: int):
+        self.iterator = iterator
+        self.length = length
+
+    def __iter__(self) -> Iterator[Any]:
+        return self.iterator
+
+    def __len__(self) -> int:
+        return self.length
+
+
+def _zip_iterables(
+    iterable: Iterable[Any], iterables: tuple[Iterable[Any], ...], star: bool
+) -> tuple[Iterable[Any], bool]:
+    """Combine the iterables of a multi-iterable map into argument tuples, like `map`."""
+    if not iterables:
+        return iterable, star
+    iterables = (iterable, *iterables)
+    if star:
+        raise TypeError("star=True takes a single iterable of argument tuples")
+    combined = zip(*iterables)
+    if all(isinstance(iterable, Sized) for iterable in iterables):
+        return _WithLength(combined, min(map(len, iterables))), True
+    return combined, True
+
+
+# Minimum time between progress updates, in seconds. Rendering an update costs far
+# more than a cheap task, so results are counted and reported in batches.
+_PROGRESS_INTERVAL = 0.1
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h {minutes:02d}m"
+    if minutes:
+        return f"{minutes}m {seconds:02d}s"
+    return f"{seconds}s"
+
+
+class _Ticker:
+    """Batches `advance(n)` calls into at most one update per `_PROGRESS_INTERVAL`.
+
+    Each update carries the rate so far, and the ETA when `total` is known, in
+    the subtitle.
+    """
+
+    def __init__(
+        self,
+        update: Callable[[int, str], None],
+        total: Optional[int],
+        subtitle: str | None,
+    ):
+        self.update = update
+        self.total = total
+        self.subtitle = subtitle
+        self.done = 0
+        self.unreported = 0
+        self.started = time.monotonic()
+        self.next_update = self.started + _PROGRESS_INTERVAL
+
+    def __call__(self, n: int) -> None:
+        self.unreported += n
+        now = time.monotonic()
+        if now >= self.next_update:
+            self.flush(now)
+
+    def flush(self, now: float) -> None:
+        self.done += self.unreported
+        rate = self.done / max(now - self.started, 1e-9)
+        parts = [self.subtitle] if self.subtitle else []
+        if self.total is None:
+            parts.append(f"{self.done:,} items")
+        parts.append(f"{rate:,.0f} items/s")
+        if self.total is not None and rate > 0:
+            parts.append(f"ETA {_format_duration((self.total - self.done) / rate)}")
+        self.update(self.unreported, " · ".join(parts))
+        self.unreported = 0
+        self.next_update = now + _PROGRESS_INTERVAL
+
+
+@contextmanager
+def _progress(
+    iterable: Iterable[Any],
+    total: Optional[int],
+    *,
+    title: str | None,
+    subtitle: str | None,
+    remove_on_exit: bool,
+    disabled: bool,
+) -> Iterator[Callable[[int], None]]:
+    """Show a progress bar, or a spinner if the length is unknown; yield `advance(n)`."""
+    if disabled:
+        yield lambda n: None
+    elif isinstance(iterable, Sized):
+        if total is None:
+            total = len(iterable)
+        with mo.status.progress_bar(
+            total=total,
+            title=title,
+            subtitle=subtitle,
+            show_rate=False,
+            show_eta=False,
+            remove_on_exit=remove_on_exit,
+        ) as bar:
+            ticker = _Ticker(
+                lambda n, text: bar.update(increment=n, subtitle=text), total, subtitle
+            )
+            yield ticker
+            ticker.flush(time.monotonic())
+    else:
+        with mo.status.spinner(
+            title=title, subtitle=subtitle, remove_on_exit=remove_on_exit
+        ) as spinner:
+            ticker = _Ticker(
+                lambda n, text: spinner.update(subtitle=text), None, subtitle
+            )
+            yield ticker
+            ticker.flush(time.monotonic())
+
+
+class _MapRun:
+    """Setup shared by `concurrent_imap` and `aconcurrent_map` for one call.
+
+    Resolves the iterables, cache and journal up front; `start` creates the
+    pool and the scheduler and `progress` the progress display, so that both
+    drivers handle every option the same way. `close` releases the journal and
+    the cache.
+    """
+
+    def __init__(
+        self,
+        pool: Type[Executor] | Executor,
+        fn: Callable[..., Any],
+        iterable: Iterable[Any],
+        iterables: tuple[Iterable[Any], ...],
+        *,
+        total: Optional[int],
+        title: str | None,
+        subtitle: str | None,
+        max_workers: Optional[int],
+        remove_on_exit: bool,
+        disabled: bool,
+        star: bool,
+        max_in_flight: Optional[int],
+        chunksize: int | Literal["auto"],
+        persistent: bool,
+        initializer: Optional[Callable[..., object]],
+        initargs: tuple[Any, ...],
+        broadcast: Optional[Mapping[str, Any]],
+        cache: ResultCache | str | os.PathLike[str] | bool | None,
+        checkpoint: str | os.PathLike[str] | None,
+        on_error: Literal["raise", "collect", "retry"],
+        retries: int,
+        backoff: float,
+        retry_on: tuple[type[Exception], ...],
+        task_timeout: Optional[float],
+        speculate: bool,
+        stats: Optional[MapStats],
+        native_threads: int | Literal["auto"] | None,
+        cost: Optional[Callable[..., float]],
+    ):
+        self.pool = pool
+        self.fn = fn
+        self.iterable, self.star = _zip_iterables(iterable, iterables, star)
+        self.total = total
+        self.title = title
+        self.subtitle = subtitle
+        self.max_workers = max_workers
+        self.remove_on_exit = remove_on_exit
+        self.disabled = disabled or _in_worker()
+        self.max_in_flight = max_in_flight
+        self.chunksize = chunksize
+        self.persistent = persistent
+        self.initializer = initializer
+        self.initargs = initargs
+        self.broadcast = broadcast
+        self.on_error = on_error
+        self.retries = retries
+        self.backoff = backoff
+        self.retry_on = retry_on
+        self.task_timeout = task_timeout
+        self.speculate = speculate
+        self.stats = stats
+        self.native_threads = native_threads
+        self.cost = cost
+        self.cache = _resolve_cache(cache)
+        self.journal = _Journal(checkpoint) if checkpoint is not None else None
+        self.fingerprint = _fingerprint(fn) if self.cache or self.journal else b""
+
+    @contextmanager
+    def start(self) -> Iterator[_Scheduler[Any, Any]]:
+        """Set up the pool, yielding the scheduler that feeds it."""
+        with _executor(
+            self.pool,
+            self.fn,
+            self.max_workers,
+            self.persistent,
+            self.initializer,
+            self.initargs,
+            self.broadcast,
+            supervised=self.task_timeout is not None or self.speculate,
+            native_threads=self.native_threads,
+        ) as (executor, task_fn):
+            yield _Scheduler(
+                executor,
+                _guard(
+                    task_fn,
+                    self.on_error,
+                    self.retries,
+                    self.backoff,
+                    self.retry_on,
+                    self.star,
+                ),
+                self.iterable,
+                max_in_flight=self.max_in_flight,
+                chunksize=self.chunksize,
+                cache=self.cache,
+                journal=self.journal,
+                fingerprint=self.fingerprint,
+                task_timeout=self.task_timeout,
+                speculate=self.speculate,
+                collect_errors=self.on_error != "raise",
+                stats=self.stats,
+                cost=self.cost,
+                star=self.star,
+            )
+
+    def close(self) -> None:
+        """Close the journal and trim the cache back to its size limit."""
+        if self.journal is not None:
+            self.journal.close()
+        if self.cache is not None:
+            self.cache.evict()
+
+    def progress(self) -> Any:
+        return _progress(
+            self.iterable,
+            self.total,
+            title=self.title,
+            subtitle=self.subtitle,
+            remove_on_exit=self.remove_on_exit,
+            disabled=self.disabled,
+        )
+
+
+def concurrent_imap[R](
+    # Note: The `Executor` abstract base class does not specify arguments in __init__(),
+    # so we specify a union of the individual types. Also, InterpreterPoolExecutor is
+    # only available in Python 3.14+, so we use a string literal to avoid import errors
+    # in older versions, but `|` unions cannot exist between a type and a string
+    # literal, so we have to union the two `Type`s separately.
+    pool: Type[ThreadPoolExecutor | ProcessPoolExecutor]
+    | Type["InterpreterPoolExecutor"]
+    | Executor,
+    fn: Callable[..., R],
+    iterable: Iterable[Any],
+    *iterables: Iterable[Any],
+    total: Optional[int] = None,
+    title: str | None = None,
+    subtitle: str | None = None,
+    max_workers: Optional[int] = None,
+    remove_on_exit: bool = False,
+    disabled: bool = False,
+    ordered: bool = True,
+    star: bool = False,
+    max_in_flight: Optional[int] = None,
+    chunksize: int | Literal["auto"] = 1,
+    persistent: bool = False,
+    initializer: Optional[Callable[..., object]] = None,
+    initargs: tuple[Any, ...] = (),
+    broadcast: Optional[Mapping[str, Any]] = None,
+    cache: ResultCache | str | os.PathLike[str] | bool | None = None,
+    checkpoint: str | os.PathLike[str] | None = None,
+    on_error: Literal["raise", "collect", "retry"] = "raise",
+    retries: int = 3,
+    backoff: float = 0.5,
+    retry_on: tuple[type[Exception], ...] = (Exception,),
+    task_timeout: Optional[float] = None,
+    speculate: bool = False,
+    stats: Optional[MapStats] = None,
+    native_threads: int | Literal["auto"] | None = "auto",
+    cost: Optional[Callable[..., float]] = None,
+) -> Iterator[R] | Iterator[tuple[int, R]]:
+    """Lazily yield `fn(item)` for each item, in input order, as results become ready.
+
+    The pool stays alive until the generator is exhausted or closed, so
+    downstream code can consume results while later items are still running.
+
+    With `ordered=False`, `(index, result)` pairs are yielded in completion order
+    instead, so one slow item does not hold back the ones submitted after it.
+
+    Given several iterables, `fn` is called with one item from each and the map
+    stops at the shortest, like `map`. With `star=True`, each item of the single
+    iterable is a tuple of arguments, as in `itertools.starmap`. Either way, the
+    arguments are unpacked in the worker rather than through a wrapper function.
+
+    `max_in_flight` bounds how many items are submitted to the pool at once; more
+    are pulled from `iterable` as results come back. By default every item is
+    submitted up front, like `Executor.map`.
+
+    `chunksize` groups items into a single task, which matters for process and
+    interpreter pools where each task costs a pickle round trip. With
+    `chunksize="auto"`, the chunk size is tuned from measured run times so that
+    each chunk takes roughly 100 ms, and unless `max_in_flight` is given, four
+    chunks per worker are kept in flight. The progress bar still counts items,
+    and `max_in_flight` then counts chunks.
+
+    `pool` is either an executor type, in which case a fresh pool is created and
+    shut down around the call (or, with `persistent=True`, taken from the
+    `get_pool` registry), or an already running executor, which is left running.
+
+    `initializer(*initargs)` runs once in each worker of a pool created here.
+    `broadcast` maps names to large read-only objects (lookup tables, models,
+    NumPy arrays) that are shipped once per worker instead of with every task;
+    `fn` reads them with `get_broadcast(name)`.
+
+    `cache` memoizes per-item results on disk (see `ResultCache`; pass `True` for
+    the default location or a directory path), so re-runs only compute items
+    that are new or whose function changed.
+
+    If the map fails or is interrupted, queued tasks are cancelled and worker
+    processes are terminated right away; thread pool tasks that are already
+    running can stop early by polling `cancelled()`.
+
+    By default the first exception raised by `fn` propagates. With
+    `on_error="collect"`, a failing item instead yields a `TaskError` record in
+    place of its result; `on_error="retry"` first retries it up to `retries`
+    times, sleeping `backoff * 2**n` seconds in between, if the exception is an
+    instance of `retry_on`.
+
+    `task_timeout` gives up on an item whose call runs longer than that many
+    seconds: its worker process is killed (the other items in progress are
+    restarted in a fresh pool) and the map raises `TimeoutError`, or yields a
+    `TaskError` for the item when errors are collected. Timed-out items are not
+    retried, and a hung thread cannot be killed, so it is left to finish in the
+    background. `task_timeout` requires `chunksize=1` and a pool created by the
+    call.
+
+    With `speculate=True`, once every item has been started, idle workers run
+    copies of the longest-running items and whichever copy finishes first is
+    used. `fn` must be safe to call twice on the same item.
+
+    Pass a `MapStats()` as `stats` to record per-item queue wait, run time,
+    worker and result size, e.g. to export a trace with `to_chrome_trace`.
+
+    In process and interpreter pools created here, OpenMP and BLAS libraries
+    are limited to `native_threads` threads per worker (by default, the CPU
+    cores divided among the workers) so that NumPy code in `fn` does not
+    oversubscribe the machine; pass `None` to leave them alone. A map called
+    from inside a process or interpreter worker of another map, or a thread map
+    called from a thread worker, runs its items inline in that worker rather
+    than starting a pool of its own.
+
+    `cost(item)` estimates how long an item takes, e.g. a file size. Items are
+    then submitted most expensive first, so a large item does not start last
+    and hold up the end of the map; results are still returned in input order.
+    The iterable is read in full up front to sort it.
+
+    `checkpoint` names a journal file that every finished `(index, result)` is
+    appended to as it arrives. If the run is interrupted, calling again with the
+    same function and inputs skips the indices already in the journal and
+    resumes with the rest. Delete the file to start over.
+    """
+    run = _MapRun(
+        pool,
+        fn,
+        iterable,
+        iterables,
+        total=total,
+        title=title,
+        subtitle=subtitle,
+        max_workers=max_workers,
+        remove_on_exit=remove_on_exit,
+        disabled=disabled,
+        star=star,
+        max_in_flight=max_in_flight,
+        chunksize=chunksize,
+        persistent=persistent,
+        initializer=initializer,
+        initargs=initargs,
+        broadcast=broadcast,
+        cache=cache,
+        checkpoint=checkpoint,
+        on_error=on_error,
+        retries=retries,
+        backoff=backoff,
+        retry_on=retry_on,
+        task_timeout=task_timeout,
+        speculate=speculate,
+        stats=stats,
+        native_threads=native_threads,
+        cost=cost,
+    )
+    try:
+        with run.start() as scheduler, run.progress() as advance:
+            reordered = ordered and cost is not None
+            arrived: dict[int, R] = {}
+            next_index = 0
+            for index, result in _submit(scheduler, ordered and not reordered):
+                advance(1)
+                if not reordered:
+                    yield result if ordered else (index, result)
+                    continue
+                # Submitted by cost; hand results back in input order.
+                arrived[index] = result
+                while next_index in arrived:
+                    yield arrived.pop(next_index)
+                    next_index += 1
+
+    except KeyboardInterrupt:
+        mo.stop(True, "Interrupted by user")
+    finally:
+        run.close()
+
+
+def concurrent_map[R](
+    pool: Type[ThreadPoolExecutor | ProcessPoolExecutor]
+    | Type["InterpreterPoolExecutor"]
+    | Executor,
+    fn: Callable[..., R],
+    iterable: Iterable[Any],
+    *iterables: Iterable[Any],
+    total: Optional[int] = None,
+    title: str | None = None,
+    subtitle: str | None = None,
+    max_workers: Optional[int] = None,
+    remove_on_exit: bool = False,
+    disabled: bool = False,
+    ordered: bool = True,
+    star: bool = False,
+    max_in_flight: Optional[int] = None,
+    chunksize: int | Literal["auto"] = 1,
+    persistent: bool = False,
+    initializer: Optional[Callable[..., object]] = None,
+    initargs: tuple[Any, ...] = (),
+    broadcast: Optional[Mapping[str, Any]] = None,
+    cache: ResultCache | str | os.PathLike[str] | bool | None = None,
+    checkpoint: str | os.PathLike[str] | None = None,
+    on_error: Literal["raise", "collect", "retry"] = "raise",
+    retries: int = 3,
+    backoff: float = 0.5,
+    retry_on: tuple[type[Exception], ...] = (Exception,),
+    task_timeout: Optional[float] = None,
+    speculate: bool = False,
+    stats: Optional[MapStats] = None,
+    native_threads: int | Literal["auto"] | None = "auto",
+    cost: Optional[Callable[..., float]] = None,
+    spill_after: Optional[int] = None,
+) -> list[R] | list[tuple[int, R]] | SpilledResults:
+    """Like `concurrent_imap`, but collects the results into a list.
+
+    `spill_after` is a number of bytes: once the pickled results pass it, the
+    rest are written to a temporary file and a `SpilledResults` sequence is
+    returned instead of a list, so outputs larger than memory can still be
+    indexed and iterated.
+    """
+    results = concurrent_imap(
+        pool,
+        fn,
+        iterable,
+        *iterables,
+        total=total,
+        title=title,
+        subtitle=subtitle,
+        max_workers=max_workers,
+        remove_on_exit=remove_on_exit,
+        disabled=disabled,
+        ordered=ordered,
+        star=star,
+        max_in_flight=max_in_flight,
+        chunksize=chunksize,
+        persistent=persistent,
+        initializer=initializer,
+        initargs=initargs,
+        broadcast=broadcast,
+        cache=cache,
+        checkpoint=checkpoint,
+        on_error=on_error,
+        retries=retries,
+        backoff=backoff,
+        retry_on=retry_on,
+        task_timeout=task_timeout,
+        speculate=speculate,
+        stats=stats,
+        native_threads=native_threads,
+        cost=cost,
+    )
+    if spill_after is None:
+        return list(results)
+    spilled = SpilledResults(spill_after)
+    try:
+        spilled.extend(results)
+    except BaseException:
+        spilled.close()
+        raise
+    return spilled
+
+
+# This could also be done with functools.partial()
+def thread_map[R](
+    fn: Callable[..., R],
+    iterable: Iterable[Any],
+    *iterables: Iterable[Any],
+    total: Optional[int] = None,
+    title: str | None = None,
+    subtitle: str | None = None,
+    max_workers: Optional[int] = None,
+    remove_on_exit: bool = False,
+    disabled: bool = False,
+    ordered: bool = True,
+    max_in_flight: Optional[int] = None,
+    chunksize: int | Literal["auto"] = 1,
+    pool: Optional[Executor] = None,
+    persistent: bool = False,
+    initializer: Optional[Callable[..., object]] = None,
+    initargs: tuple[Any, ...] = (),
+    broadcast: Optional[Mapping[str, Any]] = None,
+    cache: ResultCache | str | os.PathLike[str] | bool | None = None,
+    checkpoint: str | os.PathLike[str] | None = None,
+    on_error: Literal["raise", "collect", "retry"] = "raise",
+    retries: int = 3,
+    backoff: float = 0.5,
+    retry_on: tuple[type[Exception], ...] = (Exception,),
+    task_timeout: Optional[float] = None,
+    speculate: bool = False,
+    stats: Optional[MapStats] = None,
+    native_threads: int | Literal["auto"] | None = "auto",
+    cost: Optional[Callable[..., float]] = None,
+    spill_after: Optional[int] = None,
+) -> list[R] | list[tuple[int, R]] | SpilledResults:
+    return concurrent_map(
+        pool if pool is not None else ThreadPoolExecutor,
+        fn,
+        iterable,
+        *iterables,
+        total=total,
+        title=title,
+        subtitle=subtitle,
+        max_workers=max_workers,
+        remove_on_exit=remove_on_exit,
+        disabled=disabled,
+        ordered=ordered,
+        max_in_flight=max_in_flight,
+        chunksize=chunksize,
+        persistent=persistent,
+        initializer=initializer,
+        initargs=initargs,
+        broadcast=broadcast,
+        cache=cache,
+        checkpoint=checkpoint,
+        on_error=on_error,
+        retries=retries,
+        backoff=backoff,
+        retry_on=retry_on,
+        task_timeout=task_timeout,
+        speculate=speculate,
+        stats=stats,
+        native_threads=native_threads,
+        cost=cost,
+        spill_after=spill_after,
+    )
+
+
+def thread_imap[R](
+    fn: Callable[..., R],
+    iterable: Iterable[Any],
+    *iterables: Iterable[Any],
+    total: Optional[int] = None,
+    title: str | None = None,
+    subtitle: str | None = None,
+    max_workers: Optional[int] = None,
+    remove_on_exit: bool = False,
+    disabled: bool = False,
+    ordered: bool = True,
+    max_in_flight: Optional[int] = None,
+    chunksize: int | Literal["auto"] = 1,
+    pool: Optional[Executor] = None,
+    persistent: bool = False,
+    initializer: Optional[Callable[..., object]] = None,
+    initargs: tuple[Any, ...] = (),
+    broadcast: Optional[Mapping[str, Any]] = None,
+    cache: ResultCache | str | os.PathLike[str] | bool | None = None,
+    checkpoint: str | os.PathLike[str] | None = None,
+    on_error: Literal["raise", "collect", "retry"] = "raise",
+    retries: int = 3,
+    backoff: float = 0.5,
+    retry_on: tuple[type[Exception], ...] = (Exception,),
+    task_timeout: Optional[float] = None,
+    speculate: bool = False,
+    stats: Optional[MapStats] = None,
+    native_threads: int | Literal["auto"] | None = "auto",
+    cost: Optional[Callable[..., float]] = None,
+) -> Iterator[R] | Iterator[tuple[int, R]]:
+    return concurrent_imap(
+        pool if pool is not None else ThreadPoolExecutor,
+        fn,
+        iterable,
+        *iterables,
+        total=total,
+        title=title,
+        subtitle=subtitle,
+        max_workers=max_workers,
+        remove_on_exit=remove_on_exit,
+        disabled=disabled,
+        ordered=ordered,
+        max_in_flight=max_in_flight,
+        chunksize=chunksize,
+        persistent=persistent,
+        initializer=initializer,
+        initargs=initargs,
+        broadcast=broadcast,
+        cache=cache,
+        checkpoint=checkpoint,
+        on_error=on_error,
+        retries=retries,
+        backoff=backoff,
+        retry_on=retry_on,
+        task_timeout=task_timeout,
+        speculate=speculate,
+        stats=stats,
+        native_threads=native_threads,
+        cost=cost,
+    )
+
+
+def thread_starmap[R](
+    fn: Callable[..., R],
+    iterable: Iterable[Iterable[Any]],
+    *,
+    total: Optional[int] = None,
+    title: str | None = None,
+    subtitle: str | None = None,
+    max_workers: Optional[int] = None,
+    remove_on_exit: bool = False,
+    disabled: bool = False,
+    ordered: bool = True,
+    max_in_flight: Optional[int] = None,
+    chunksize: int | Literal["auto"] = 1,
+    pool: Optional[Executor] = None,
+    persistent: bool = False,
+    initializer: Optional[Callable[..., object]] = None,
+    initargs: tuple[Any, ...] = (),
+    broadcast: Optional[Mapping[str, Any]] = None,
+    cache: ResultCache | str | os.PathLike[str] | bool | None = None,
+    checkpoint: str | os.PathLike[str] | None = None,
+    on_error: Literal["raise", "collect", "retry"] = "raise",
+    retries: int = 3,
+    backoff: float = 0.5,
+    retry_on: tuple[type[Exception], ...] = (Exception,),
+    task_timeout: Optional[float] = None,
+    speculate: bool = False,
+    stats: Optional[MapStats] = None,
+    native_threads: int | Literal["auto"] | None = "auto",
+    cost: Optional[Callable[..., float]] = None,
+    spill_after: Optional[int] = None,
+) -> list[R] | list[tuple[int, R]] | SpilledResults:
+    return concurrent_map(
+        pool if pool is not None else ThreadPoolExecutor,
+        fn,
+        iterable,
+        total=total,
+        title=title,
+        subtitle=subtitle,
+        max_workers=max_workers,
+        remove_on_exit=remove_on_exit,
+        disabled=disabled,
+        ordered=ordered,
+        star=True,
+        max_in_flight=max_in_flight,
+        chunksize=chunksize,
+        persistent=persistent,
+        initializer=initializer,
+        initargs=initargs,
+        broadcast=broadcast,
+        cache=cache,
+        checkpoint=checkpoint,
+        on_error=on_error,
+        retries=retries,
+        backoff=backoff,
+        retry_on=retry_on,
+        task_timeout=task_timeout,
+        speculate=speculate,
+        stats=stats,
+        native_threads=native_threads,
+        cost=cost,
+        spill_after=spill_after,
+    )
+
+
+def process_map[R](
+    fn: Callable[..., R],
+    iterable: Iterable[Any],
+    *iterables: Iterable[Any],
+    total: Optional[int] = None,
+    title: str | None = None,
+    subtitle: str | None = None,
+    max_workers: Optional[int] = None,
+    remove_on_exit: bool = False,
+    disabled: bool = False,
+    ordered: bool = True,
+    max_in_flight: Optional[int] = None,
+    chunksize: int | Literal["auto"] = 1,
+    pool: Optional[Executor] = None,
+    persistent: bool = False,
+    initializer: Optional[Callable[..., object]] = None,
+    initargs: tuple[Any, ...] = (),
+    broadcast: Optional[Mapping[str, Any]] = None,
+    cache: ResultCache | str | os.PathLike[str] | bool | None = None,
+    checkpoint: str | os.PathLike[str] | None = None,
+    on_error: Literal["raise", "collect", "retry"] = "raise",
+    retries: int = 3,
+    backoff: float = 0.5,
+    retry_on: tuple[type[Exception], ...] = (Exception,),
+    task_timeout: Optional[float] = None,
+    speculate: bool = False,
+    stats: Optional[MapStats] = None,
+    native_threads: int | Literal["auto"] | None = "auto",
+    cost: Optional[Callable[..., float]] = None,
+    spill_after: Optional[int] = None,
+) -> list[R] | list[tuple[int, R]] | SpilledResults:
+    return concurrent_map(
+        pool if pool is not None else ProcessPoolExecutor,
+        fn,
+        iterable,
+        *iterables,
+        total=total,
+        title=title,
+        subtitle=subtitle,
+        max_workers=max_workers,
+        remove_on_exit=remove_on_exit,
+        disabled=disabled,
+        ordered=ordered,
+        max_in_flight=max_in_flight,
+        chunksize=chunksize,
+        persistent=persistent,
+        initializer=initializer,
+        initargs=initargs,
+        broadcast=broadcast,
+        cache=cache,
+        checkpoint=checkpoint,
+        on_error=on_error,
+        retries=retries,
+        backoff=backoff,
+        retry_on=retry_on,
+        task_timeout=task_timeout,
+        speculate=speculate,
+        stats=stats,
+        native_threads=native_threads,
+        cost=cost,
+        spill_after=spill_after,
+    )
+
+
+def process_imap[R](
+    fn: Callable[..., R],
+    iterable: Iterable[Any],
+    *iterables: Iterable[Any],
+    total: Optional[int] = None,
+    title: str | None = None,
+    subtitle: str | None = None,
+    max_workers: Optional[int] = None,
+    remove_on_exit: bool = False,
+    disabled: bool = False,
+    ordered: bool = True,
+    max_in_flight: Optional[int] = None,
+    chunksize: int | Literal["auto"] = 1,
+    pool: Optional[Executor] = None,
+    persistent: bool = False,
+    initializer: Optional[Callable[..., object]] = None,
+    initargs: tuple[Any, ...] = (),
+    broadcast: Optional[Mapping[str, Any]] = None,
+    cache: ResultCache | str | os.PathLike[str] | bool | None = None,
+    checkpoint: str | os.PathLike[str] | None = None,
+    on_error: Literal["raise", "collect", "retry"] = "raise",
+    retries: int = 3,
+    backoff: float = 0.5,
+    retry_on: tuple[type[Exception], ...] = (Exception,),
+    task_timeout: Optional[float] = None,
+    speculate: bool = False,
+    stats: Optional[MapStats] = None,
+    native_threads: int | Literal["auto"] | None = "auto",
+    cost: Optional[Callable[..., float]] = None,
+) -> Iterator[R] | Iterator[tuple[int, R]]:
+    return concurrent_imap(
+        pool if pool is not None else ProcessPoolExecutor,
+        fn,
+        iterable,
+        *iterables,
+        total=total,
+        title=title,
+        subtitle=subtitle,
+        max_workers=max_workers,
+        remove_on_exit=remove_on_exit,
+        disabled=disabled,
+        ordered=ordered,
+        max_in_flight=max_in_flight,
+        chunksize=chunksize,
+        persistent=persistent,
+        initializer=initializer,
+        initargs=initargs,
+        broadcast=broadcast,
+        cache=cache,
+        checkpoint=checkpoint,
+        on_error=on_error,
+        retries=retries,
+        backoff=backoff,
+        retry_on=retry_on,
+        task_timeout=task_timeout,
+        speculate=speculate,
+        stats=stats,
+        native_threads=native_threads,
+        cost=cost,
+    )
+
+
+def process_starmap[R](
+    fn: Callable[..., R],
+    iterable: Iterable[Iterable[Any]],
+    *,
+    total: Optional[int] = None,
+    title: str | None = None,
+    subtitle: str | None = None,
+    max_workers: Optional[int] = None,
+    remove_on_exit: bool = False,
+    disabled: bool = False,
+    ordered: bool = True,
+    max_in_flight: Optional[int] = None,
+    chunksize: int | Literal["auto"] = 1,
+    pool: Optional[Executor] = None,
+    persistent: bool = False,
+    initializer: Optional[Callable[..., object]] = None,
+    initargs: tuple[Any, ...] = (),
+    broadcast: Optional[Mapping[str, Any]] = None,
+    cache: ResultCache | str | os.PathLike[str] | bool | None = None,
+    checkpoint: str | os.PathLike[str] | None = None,
+    on_error: Literal["raise", "collect", "retry"] = "raise",
+    retries: int = 3,
+    backoff: float = 0.5,
+    retry_on: tuple[type[Exception], ...] = (Exception,),
+    task_timeout: Optional[float] = None,
+    speculate: bool = False,
+    stats: Optional[MapStats] = None,
+    native_threads: int | Literal["auto"] | None = "auto",
+    cost: Optional[Callable[..., float]] = None,
+    spill_after: Optional[int] = None,
+) -> list[R] | list[tuple[int, R]] | SpilledResults:
+    return concurrent_map(
+        pool if pool is not None else ProcessPoolExecutor,
+        fn,
+        iterable,
+        total=total,
+        title=title,
+        subtitle=subtitle,
+        max_workers=max_workers,
+        remove_on_exit=remove_on_exit,
+        disabled=disabled,
+        ordered=ordered,
+        star=True,
+        max_in_flight=max_in_flight,
+        chunksize=chunksize,
+        persistent=persistent,
+        initializer=initializer,
+        initargs=initargs,
+        broadcast=broadcast,
+        cache=cache,
+        checkpoint=checkpoint,
+        on_error=on_error,
+        retries=retries,
+        backoff=backoff,
+        retry_on=retry_on,
+        task_timeout=task_timeout,
+        speculate=speculate,
+        stats=stats,
+        native_threads=native_threads,
+        cost=cost,
+        spill_after=spill_after,
+    )
+
+
+def cpu_map[R](
+    fn: Callable[..., R],
+    iterable: Iterable[Any],
+    *iterables: Iterable[Any],
+    total: Optional[int] = None,
+    title: str | None = None,
+    subtitle: str | None = None,
+    max_workers: Optional[int] = None,
+    remove_on_exit: bool = False,
+    disabled: bool = False,
+    ordered: bool = True,
+    max_in_flight: Optional[int] = None,
+    chunksize: int | Literal["auto"] = 1,
+    persistent: bool = False,
+    initializer: Optional[Callable[..., object]] = None,
+    initargs: tuple[Any, ...] = (),
+    broadcast: Optional[Mapping[str, Any]] = None,
+    cache: ResultCache | str | os.PathLike[str] | bool | None = None,
+    checkpoint: str | os.PathLike[str] | None = None,
+    on_error: Literal["raise", "collect", "retry"] = "raise",
+    retries: int = 3,
+    backoff: float = 0.5,
+    retry_on: tuple[type[Exception], ...] = (Exception,),
+    task_timeout: Optional[float] = None,
+    speculate: bool = False,
+    stats: Optional[MapStats] = None,
+    native_threads: int | Literal["auto"] | None = "auto",
+    cost: Optional[Callable[..., float]] = None,
+    spill_after: Optional[int] = None,
+) -> list[R] | list[tuple[int, R]] | SpilledResults:
+    """`process_map` for CPU-bound `fn`, or `thread_map` on free-threaded Python.
+
+    Without the GIL, threads run Python code in parallel and nothing has to be
+    pickled, so they are used whenever `gil_enabled()` is false. `max_workers`
+    defaults to the number of CPU cores either way.
+    """
+    return concurrent_map(
+        _cpu_pool(),
+        fn,
+        iterable,
+        *iterables,
+        total=total,
+        title=title,
+        subtitle=subtitle,
+        max_workers=max_workers or _cpu_count(),
+        remove_on_exit=remove_on_exit,
+        disabled=disabled,
+        ordered=ordered,
+        max_in_flight=max_in_flight,
+        chunksize=chunksize,
+        persistent=persistent,
+        initializer=initializer,
+        initargs=initargs,
+        broadcast=broadcast,
+        cache=cache,
+        checkpoint=checkpoint,
+        on_error=on_error,
+        retries=retries,
+        backoff=backoff,
+        retry_on=retry_on,
+        task_timeout=task_timeout,
+        speculate=speculate,
+        stats=stats,
+        native_threads=native_threads,
+        cost=cost,
+        spill_after=spill_after,
+    )
+
 
 if sys.version_info >= (3, 14):
-    from concurrent.futures import InterpreterPoolExecutor
 
+    def interpreter_map[R](
+        fn: Callable[..., R],
+        iterable: Iterable[Any],
+        *iterables: Iterable[Any],
+        total: Optional[int] = None,
+        title: str | None = None,
+        subtitle: str | None = None,
+        max_workers: Optional[int] = None,
+        remove_on_exit: bool = False,
+        disabled: bool = False,
+        ordered: bool = True,
+        max_in_flight: Optional[int] = None,
+        chunksize: int | Literal["auto"] = 1,
+        pool: Optional[Executor] = None,
+        persistent: bool = False,
+        initializer: Optional[Callable[..., object]] = None,
+        initargs: tuple[Any, ...] = (),
+        broadcast: Optional[Mapping[str, Any]] = None,
+        cache: ResultCache | str | os.PathLike[str] | bool | None = None,
+        checkpoint: str | os.PathLike[str] | None = None,
+        on_error: Literal["raise", "collect", "retry"] = "raise",
+        retries: int = 3,
+        backoff: float = 0.5,
+        retry_on: tuple[type[Exception], ...] = (Exception,),
+        task_timeout: Optional[float] = None,
+        speculate: bool = False,
+        stats: Optional[MapStats] = None,
+        native_threads: int | Literal["auto"] | None = "auto",
+        cost: Optional[Callable[..., float]] = None,
+        spill_after: Optional[int] = None,
+    ) -> list[R] | list[tuple[int, R]] | SpilledResults:
+        return concurrent_map(
+            pool if pool is not None else InterpreterPoolExecutor,
+            fn,
+            iterable,
+            *iterables,
+            total=total,
+            title=title,
+            subtitle=subtitle,
+            max_workers=max_workers,
+            remove_on_exit=remove_on_exit,
+            disabled=disabled,
+            ordered=ordered,
+            max_in_flight=max_in_flight,
+            chunksize=chunksize,
+            persistent=persistent,
+            initializer=initializer,
+            initargs=initargs,
+            broadcast=broadcast,
+            cache=cache,
+            checkpoint=checkpoint,
+            on_error=on_error,
+            retries=retries,
+            backoff=backoff,
+            retry_on=retry_on,
+            task_timeout=task_timeout,
+            speculate=speculate,
+            stats=stats,
+            native_threads=native_threads,
+            cost=cost,
+            spill_after=spill_after,
+        )
+
+    def interpreter_imap[R](
+        fn: Callable[..., R],
+        iterable: Iterable[Any],
+        *iterables: Iterable[Any],
+        total: Optional[int] = None,
+        title: str | None = None,
+        subtitle: str | None = None,
+        max_workers: Optional[int] = None,
+        remove_on_exit: bool = False,
+        disabled: bool = False,
+        ordered: bool = True,
+        max_in_flight: Optional[int] = None,
+        chunksize: int | Literal["auto"] = 1,
+        pool: Optional[Executor] = None,
+        persistent: bool = False,
+        initializer: Optional[Callable[..., object]] = None,
+        initargs: tuple[Any, ...] = (),
+        broadcast: Optional[Mapping[str, Any]] = None,
+        cache: ResultCache | str | os.PathLike[str] | bool | None = None,
+        checkpoint: str | os.PathLike[str] | None = None,
+        on_error: Literal["raise", "collect", "retry"] = "raise",
+        retries: int = 3,
+        backoff: float = 0.5,
+        retry_on: tuple[type[Exception], ...] = (Exception,),
+        task_timeout: Optional[float] = None,
+        speculate: bool = False,
+        stats: Optional[MapStats] = None,
+        native_threads: int | Literal["auto"] | None = "auto",
+        cost: Optional[Callable[..., float]] = None,
+    ) -> Iterator[R] | Iterator[tuple[int, R]]:
+        return concurrent_imap(
+            pool if pool is not None else InterpreterPoolExecutor,
+            fn,
+            iterable,
+            *iterables,
+            total=total,
+            title=title,
+            subtitle=subtitle,
+            max_workers=max_workers,
+            remove_on_exit=remove_on_exit,
+            disabled=disabled,
+            ordered=ordered,
+            max_in_flight=max_in_flight,
+            chunksize=chunksize,
+            persistent=persistent,
+            initializer=initializer,
+            initargs=initargs,
+            broadcast=broadcast,
+            cache=cache,
+            checkpoint=checkpoint,
+            on_error=on_error,
+            retries=retries,
+            backoff=backoff,
+            retry_on=retry_on,
+            task_timeout=task_timeout,
+            speculate=speculate,
+            stats=stats,
+            native_threads=native_threads,
+            cost=cost,
+        )
 
-import marimo as mo
+    def interpreter_starmap[R](
+        fn: Callable[..., R],
+        iterable: Iterable[Iterable[Any]],
+        *,
+        total: Optional[int] = None,
+        title: str | None = None,
+        subtitle: str | None = None,
+        max_workers: Optional[int] = None,
+        remove_on_exit: bool = False,
+        disabled: bool = False,
+        ordered: bool = True,
+        max_in_flight: Optional[int] = None,
+        chunksize: int | Literal["auto"] = 1,
+        pool: Optional[Executor] = None,
+        persistent: bool = False,
+        initializer: Optional[Callable[..., object]] = None,
+        initargs: tuple[Any, ...] = (),
+        broadcast: Optional[Mapping[str, Any]] = None,
+        cache: ResultCache | str | os.PathLike[str] | bool | None = None,
+        checkpoint: str | os.PathLike[str] | None = None,
+        on_error: Literal["raise", "collect", "retry"] = "raise",
+        retries: int = 3,
+        backoff: float = 0.5,
+        retry_on: tuple[type[Exception], ...] = (Exception,),
+        task_timeout: Optional[float] = None,
+        speculate: bool = False,
+        stats: Optional[MapStats] = None,
+        native_threads: int | Literal["auto"] | None = "auto",
+        cost: Optional[Callable[..., float]] = None,
+        spill_after: Optional[int] = None,
+    ) -> list[R] | list[tuple[int, R]] | SpilledResults:
+        return concurrent_map(
+            pool if pool is not None else InterpreterPoolExecutor,
+            fn,
+            iterable,
+            total=total,
+            title=title,
+            subtitle=subtitle,
+            max_workers=max_workers,
+            remove_on_exit=remove_on_exit,
+            disabled=disabled,
+            ordered=ordered,
+            star=True,
+            max_in_flight=max_in_flight,
+            chunksize=chunksize,
+            persistent=persistent,
+            initializer=initializer,
+            initargs=initargs,
+            broadcast=broadcast,
+            cache=cache,
+            checkpoint=checkpoint,
+            on_error=on_error,
+            retries=retries,
+            backoff=backoff,
+            retry_on=retry_on,
+            task_timeout=task_timeout,
+            speculate=speculate,
+            stats=stats,
+            native_threads=native_threads,
+            cost=cost,
+            spill_after=spill_after,
+        )
 
+else:
 
-def concurrent_map[T, R](
-    # Note: The `Executor` abstract base class does not specify arguments in __init__(),
-    # so we specify a union of the individual types. Also, InterpreterPoolExecutor is
-    # only available in Python 3.14+, so we use a string literal to avoid import errors
-    # in older versions, but `|` unions cannot exist between a type and a string
-    # literal, so we have to union the two `Type`s separately.
-    pool: Type[ThreadPoolExecutor | ProcessPoolExecutor]
-    | Type["InterpreterPoolExecutor"],
+    def interpreter_map(*args, **kwargs) -> list[None]:
+        raise NotImplementedError(
+            "InterpreterPoolExecutor is not available in Python < 3.14"
+        )
+
+    def interpreter_imap(*args, **kwargs) -> Iterator[None]:
+        raise NotImplementedError(
+            "InterpreterPoolExecutor is not available in Python < 3.14"
+        )
+
+    def interpreter_starmap(*args, **kwargs) -> list[None]:
+        raise NotImplementedError(
+            "InterpreterPoolExecutor is not available in Python < 3.14"
+        )
+
+
+def _backends() -> dict[str, Type[Executor]]:
+    """Executor types that `auto_map` can choose from on this interpreter."""
+    backends: dict[str, Type[Executor]] = {
+        "threads": ThreadPoolExecutor,
+        "processes": ProcessPoolExecutor,
+    }
+    if sys.version_info >= (3, 14):
+        backends["interpreters"] = InterpreterPoolExecutor
+    return backends
+
+
+class BackendReport:
+    """How `auto_map` chose its backend, filled in when passed as `report=`.
+
+    `seconds_per_item` is the measured wall time per sample item on each backend,
+    and `speedups` compares it with calling `fn` serially. Backends that could not
+    be tried are listed in `skipped` with the reason.
+    """
+
+    def __init__(self):
+        self.backend: Optional[str] = None
+        self.seconds_per_item: dict[str, float] = {}
+        self.speedups: dict[str, float] = {}
+        self.skipped: dict[str, str] = {}
+
+    def __repr__(self) -> str:
+        speedups = ", ".join(f"{name}: {x:.1f}x" for name, x in self.speedups.items())
+        return f"BackendReport(backend={self.backend!r}, speedups={{{speedups}}})"
+
+
+def auto_map[T, R](
     fn: Callable[[T], R],
     iterable: Iterable[T],
     *,
+    sample_size: Optional[int] = None,
     total: Optional[int] = None,
     title: str | None = None,
     subtitle: str | None = None,
     max_workers: Optional[int] = None,
     remove_on_exit: bool = False,
     disabled: bool = False,
+    chunksize: int | Literal["auto"] = 1,
+    report: Optional[BackendReport] = None,
 ) -> list[R]:
-    results = []
+    """`concurrent_map` on whichever executor runs a sample of the items fastest.
+
+    The first `sample_size` items (twice the worker count by default) are timed
+    serially and on a warmed-up pool of each backend available here: threads,
+    processes and, on Python 3.14+, interpreters. The rest of the items then
+    run on the fastest pool. Sample items are computed once per backend, so `fn`
+    should be free of side effects. Backends that need pickling are skipped if
+    `fn` or the items cannot be pickled.
+
+    The chosen backend and its speedup over serial calls are shown in the
+    progress subtitle; pass a `BackendReport` as `report` to inspect all the
+    measurements.
+    """
+    if sample_size is not None and sample_size < 1:
+        raise ValueError("sample_size must be at least 1")
+    if report is None:
+        report = BackendReport()
+    workers = max_workers or _cpu_count()
+    if isinstance(iterable, Sized) and total is None:
+        total = len(iterable)
+    items = iter(iterable)
+    sample = list(islice(items, sample_size or 2 * workers))
+    if not sample:
+        return []
+    backends = _backends()
     try:
-        with pool(max_workers=max_workers) as executor:
-            futures = executor.map(fn, iterable)
-            if disabled:
-                results = list(futures)
-            elif isinstance(iterable, Sized):
-                if total is None:
-                    total = len(iterable)
-                results = list(
-                    mo.status.progress_bar(
-                        futures,
-                        total=total,
-                        title=title,
-                        subtitle=subtitle,
-                        remove_on_exit=remove_on_exit,
-                    )
+        pickle.dumps((fn, sample))
+    except Exception as e:
+        for name in ("processes", "interpreters"):
+            if backends.pop(name, None) is not None:
+                report.skipped[name] = f"not picklable: {e}"
+    try:
+        with ExitStack() as stack:
+            with (
+                nullcontext()
+                if disabled
+                else mo.status.spinner(
+                    title="Choosing a backend",
+                    subtitle=subtitle,
+                    remove_on_exit=True,
                 )
-            else:
-                with mo.status.spinner(
-                    title=title, subtitle=subtitle, remove_on_exit=remove_on_exit
-                ):
-                    results = list(futures)
+            ):
+                head = sample[: max(1, len(sample) // workers)]
+                start = time.perf_counter()
+                for item in head:
+                    fn(item)
+                serial = (time.perf_counter() - start) / len(head)
+                pools = {}
+                for name, pool_type in backends.items():
+                    pool = stack.enter_context(
+                        _owned(pool_type(max_workers=max_workers))
+                    )
+                    # Start every worker first, so startup is not counted.
+                    wait([pool.submit(int) for _ in range(pool._max_workers)])
+                    start = time.perf_counter()
+                    results = concurrent_map(
+                        pool, fn, sample, chunksize=chunksize, disabled=True
+                    )
+                    report.seconds_per_item[name] = (time.perf_counter() - start) / len(
+                        sample
+                    )
+                    pools[name] = (pool, results)
+            report.backend = min(
+                report.seconds_per_item, key=report.seconds_per_item.get
+            )
+            report.speedups = {
+                name: serial / max(seconds, 1e-9)
+                for name, seconds in report.seconds_per_item.items()
+            }
+            for name, (pool, _) in pools.items():
+                if name != report.backend:
+                    pool.shutdown()
+            pool, results = pools[report.backend]
+            rest = items if total is None else _WithLength(items, total - len(sample))
+            choice = f"{report.backend}, {report.speedups[report.backend]:.1f}x serial"
+            return results + concurrent_map(
+                pool,
+                fn,
+                rest,
+                title=title,
+                subtitle=f"{subtitle} · {choice}" if subtitle else choice,
+                remove_on_exit=remove_on_exit,
+                disabled=disabled,
+                chunksize=chunksize,
+            )
+    except KeyboardInterrupt:
+        mo.stop(True, "Interrupted by user")
+
+
+async def aconcurrent_map[R](
+    pool: Type[ThreadPoolExecutor | ProcessPoolExecutor]
+    | Type["InterpreterPoolExecutor"]
+    | Executor,
+    fn: Callable[..., R],
+    iterable: Iterable[Any],
+    *iterables: Iterable[Any],
+    total: Optional[int] = None,
+    title: str | None = None,
+    subtitle: str | None = None,
+    max_workers: Optional[int] = None,
+    remove_on_exit: bool = False,
+    disabled: bool = False,
+    ordered: bool = True,
+    star: bool = False,
+    max_in_flight: Optional[int] = None,
+    chunksize: int | Literal["auto"] = 1,
+    persistent: bool = False,
+    initializer: Optional[Callable[..., object]] = None,
+    initargs: tuple[Any, ...] = (),
+    broadcast: Optional[Mapping[str, Any]] = None,
+    cache: ResultCache | str | os.PathLike[str] | bool | None = None,
+    checkpoint: str | os.PathLike[str] | None = None,
+    on_error: Literal["raise", "collect", "retry"] = "raise",
+    retries: int = 3,
+    backoff: float = 0.5,
+    retry_on: tuple[type[Exception], ...] = (Exception,),
+    task_timeout: Optional[float] = None,
+    speculate: bool = False,
+    stats: Optional[MapStats] = None,
+    native_threads: int | Literal["auto"] | None = "auto",
+    cost: Optional[Callable[..., float]] = None,
+) -> list[R] | list[tuple[int, R]]:
+    """Awaitable `concurrent_map` that keeps the event loop free while it runs.
 
+    Executor futures are bridged with `asyncio.wrap_future`, so other cells and
+    UI interactions are served while the map is in progress, and the progress
+    bar advances as tasks finish. With `ordered=False`, `(index, result)` pairs
+    are returned in completion order.
+    """
+    run = _MapRun(
+        pool,
+        fn,
+        iterable,
+        iterables,
+        total=total,
+        title=title,
+        subtitle=subtitle,
+        max_workers=max_workers,
+        remove_on_exit=remove_on_exit,
+        disabled=disabled,
+        star=star,
+        max_in_flight=max_in_flight,
+        chunksize=chunksize,
+        persistent=persistent,
+        initializer=initializer,
+        initargs=initargs,
+        broadcast=broadcast,
+        cache=cache,
+        checkpoint=checkpoint,
+        on_error=on_error,
+        retries=retries,
+        backoff=backoff,
+        retry_on=retry_on,
+        task_timeout=task_timeout,
+        speculate=speculate,
+        stats=stats,
+        native_threads=native_threads,
+        cost=cost,
+    )
+    stack = ExitStack()
+    pairs = []
+    try:
+        try:
+            scheduler = stack.enter_context(run.start())
+            with run.progress() as advance:
+                results = _asubmit(scheduler)
+                async with aclosing(results):
+                    async for pair in results:
+                        pairs.append(pair)
+                        advance(1)
+        except BaseException as e:
+            # Aborting the pool does not wait for its tasks, so this is quick.
+            stack.__exit__(type(e), e, e.__traceback__)
+            raise
+        # A graceful shutdown joins the workers; do that off the event loop.
+        await asyncio.to_thread(stack.close)
     except KeyboardInterrupt:
         mo.stop(True, "Interrupted by user")
-    return results
+    finally:
+        await asyncio.to_thread(run.close)
+    if ordered:
+        pairs.sort(key=lambda pair: pair[0])
+        return [result for _, result in pairs]
+    return pairs
 
 
-# This could also be done with functools.partial()
-def thread_map[T, R](
-    fn: Callable[[T], R],
-    iterable: Iterable[T],
-    *,
+async def athread_map[R](
+    fn: Callable[..., R],
+    iterable: Iterable[Any],
+    *iterables: Iterable[Any],
     total: Optional[int] = None,
     title: str | None = None,
     subtitle: str | None = None,
     max_workers: Optional[int] = None,
     remove_on_exit: bool = False,
     disabled: bool = False,
-) -> list[R]:
-    return concurrent_map(
-        ThreadPoolExecutor,
+    ordered: bool = True,
+    max_in_flight: Optional[int] = None,
+    chunksize: int | Literal["auto"] = 1,
+    pool: Optional[Executor] = None,
+    persistent: bool = False,
+    initializer: Optional[Callable[..., object]] = None,
+    initargs: tuple[Any, ...] = (),
+    broadcast: Optional[Mapping[str, Any]] = None,
+    cache: ResultCache | str | os.PathLike[str] | bool | None = None,
+    checkpoint: str | os.PathLike[str] | None = None,
+    on_error: Literal["raise", "collect", "retry"] = "raise",
+    retries: int = 3,
+    backoff: float = 0.5,
+    retry_on: tuple[type[Exception], ...] = (Exception,),
+    task_timeout: Optional[float] = None,
+    speculate: bool = False,
+    stats: Optional[MapStats] = None,
+    native_threads: int | Literal["auto"] | None = "auto",
+    cost: Optional[Callable[..., float]] = None,
+) -> list[R] | list[tuple[int, R]]:
+    return await aconcurrent_map(
+        pool if pool is not None else ThreadPoolExecutor,
         fn,
         iterable,
+        *iterables,
         total=total,
         title=title,
         subtitle=subtitle,
         max_workers=max_workers,
         remove_on_exit=remove_on_exit,
         disabled=disabled,
+        ordered=ordered,
+        max_in_flight=max_in_flight,
+        chunksize=chunksize,
+        persistent=persistent,
+        initializer=initializer,
+        initargs=initargs,
+        broadcast=broadcast,
+        cache=cache,
+        checkpoint=checkpoint,
+        on_error=on_error,
+        retries=retries,
+        backoff=backoff,
+        retry_on=retry_on,
+        task_timeout=task_timeout,
+        speculate=speculate,
+        stats=stats,
+        native_threads=native_threads,
+        cost=cost,
     )
 
 
-def process_map[T, R](
-    fn: Callable[[T], R],
-    iterable: Iterable[T],
-    *,
+async def aprocess_map[R](
+    fn: Callable[..., R],
+    iterable: Iterable[Any],
+    *iterables: Iterable[Any],
     total: Optional[int] = None,
     title: str | None = None,
     subtitle: str | None = None,
     max_workers: Optional[int] = None,
     remove_on_exit: bool = False,
     disabled: bool = False,
-) -> list[R]:
-    return concurrent_map(
-        ProcessPoolExecutor,
+    ordered: bool = True,
+    max_in_flight: Optional[int] = None,
+    chunksize: int | Literal["auto"] = 1,
+    pool: Optional[Executor] = None,
+    persistent: bool = False,
+    initializer: Optional[Callable[..., object]] = None,
+    initargs: tuple[Any, ...] = (),
+    broadcast: Optional[Mapping[str, Any]] = None,
+    cache: ResultCache | str | os.PathLike[str] | bool | None = None,
+    checkpoint: str | os.PathLike[str] | None = None,
+    on_error: Literal["raise", "collect", "retry"] = "raise",
+    retries: int = 3,
+    backoff: float = 0.5,
+    retry_on: tuple[type[Exception], ...] = (Exception,),
+    task_timeout: Optional[float] = None,
+    speculate: bool = False,
+    stats: Optional[MapStats] = None,
+    native_threads: int | Literal["auto"] | None = "auto",
+    cost: Optional[Callable[..., float]] = None,
+) -> list[R] | list[tuple[int, R]]:
+    return await aconcurrent_map(
+        pool if pool is not None else ProcessPoolExecutor,
         fn,
         iterable,
+        *iterables,
         total=total,
         title=title,
         subtitle=subtitle,
         max_workers=max_workers,
         remove_on_exit=remove_on_exit,
         disabled=disabled,
+        ordered=ordered,
+        max_in_flight=max_in_flight,
+        chunksize=chunksize,
+        persistent=persistent,
+        initializer=initializer,
+        initargs=initargs,
+        broadcast=broadcast,
+        cache=cache,
+        checkpoint=checkpoint,
+        on_error=on_error,
+        retries=retries,
+        backoff=backoff,
+        retry_on=retry_on,
+        task_timeout=task_timeout,
+        speculate=speculate,
+        stats=stats,
+        native_threads=native_threads,
+        cost=cost,
     )
 
 
 if sys.version_info >= (3, 14):
 
-    def interpreter_map[T, R](
-        fn: Callable[[T], R],
-        iterable: Iterable[T],
-        *,
+    async def ainterpreter_map[R](
+        fn: Callable[..., R],
+        iterable: Iterable[Any],
+        *iterables: Iterable[Any],
         total: Optional[int] = None,
         title: str | None = None,
         subtitle: str | None = None,
         max_workers: Optional[int] = None,
         remove_on_exit: bool = False,
         disabled: bool = False,
-    ) -> list[R]:
-        return concurrent_map(
-            InterpreterPoolExecutor,
+        ordered: bool = True,
+        max_in_flight: Optional[int] = None,
+        chunksize: int | Literal["auto"] = 1,
+        pool: Optional[Executor] = None,
+        persistent: bool = False,
+        initializer: Optional[Callable[..., object]] = None,
+        initargs: tuple[Any, ...] = (),
+        broadcast: Optional[Mapping[str, Any]] = None,
+        cache: ResultCache | str | os.PathLike[str] | bool | None = None,
+        checkpoint: str | os.PathLike[str] | None = None,
+        on_error: Literal["raise", "collect", "retry"] = "raise",
+        retries: int = 3,
+        backoff: float = 0.5,
+        retry_on: tuple[type[Exception], ...] = (Exception,),
+        task_timeout: Optional[float] = None,
+        speculate: bool = False,
+        stats: Optional[MapStats] = None,
+        native_threads: int | Literal["auto"] | None = "auto",
+        cost: Optional[Callable[..., float]] = None,
+    ) -> list[R] | list[tuple[int, R]]:
+        return await aconcurrent_map(
+            pool if pool is not None else InterpreterPoolExecutor,
             fn,
             iterable,
+            *iterables,
             total=total,
             title=title,
             subtitle=subtitle,
             max_workers=max_workers,
             remove_on_exit=remove_on_exit,
             disabled=disabled,
+            ordered=ordered,
+            max_in_flight=max_in_flight,
+            chunksize=chunksize,
+            persistent=persistent,
+            initializer=initializer,
+            initargs=initargs,
+            broadcast=broadcast,
+            cache=cache,
+            checkpoint=checkpoint,
+            on_error=on_error,
+            retries=retries,
+            backoff=backoff,
+            retry_on=retry_on,
+            task_timeout=task_timeout,
+            speculate=speculate,
+            stats=stats,
+            native_threads=native_threads,
+            cost=cost,
         )
+
 else:
 
-    def interpreter_map(*args, **kwargs) -> list[None]:
+    async def ainterpreter_map(*args, **kwargs) -> list[None]:
         raise NotImplementedError(
             "InterpreterPoolExecutor is not available in Python < 3.14"
         )
+
+
+async def async_map[T, R](
+    fn: Callable[[T], Awaitable[R]],
+    iterable: Iterable[T],
+    *,
+    concurrency: int = 100,
+    total: Optional[int] = None,
+    title: str | None = None,
+    subtitle: str | None = None,
+    remove_on_exit: bool = False,
+    disabled: bool = False,
+    ordered: bool = True,
+) -> list[R] | list[tuple[int, R]]:
+    """Await `fn(item)` for every item on the running event loop.
+
+    At most `concurrency` coroutines are in flight at once, and items are pulled
+    from `iterable` only as earlier ones finish, so I/O-bound work can keep
+    thousands of requests in flight without a thread per request. Progress and
+    `ordered` behave as in `concurrent_map`.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+    items = enumerate(iterable)
+    pending: dict[asyncio.Future[R], int] = {}
+    pairs = []
+
+    def fill() -> None:
+        for i, item in islice(items, concurrency - len(pending)):
+            pending[asyncio.ensure_future(fn(item))] = i
+
+    try:
+        with _progress(
+            iterable,
+            total,
+            title=title,
+            subtitle=subtitle,
+            remove_on_exit=remove_on_exit,
+            disabled=disabled,
+        ) as advance:
+            fill()
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    pairs.append((pending.pop(task), task.result()))
+                advance(len(done))
+                fill()
+    except KeyboardInterrupt:
+        mo.stop(True, "Interrupted by user")
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    if ordered:
+        pairs.sort(key=lambda pair: pair[0])
+        return [result for _, result in pairs]
+    return pairs
+
+
+# Names under which `array_map` broadcasts its buffers to the workers.
+_ARRAY_INPUT = "moutils.array_map.input"
+_ARRAY_OUTPUT = "moutils.array_map.output"
+
+
+def _array_block(fn: Callable[[Any], Any], bounds: tuple[int, int]) -> None:
+    start, stop = bounds
+    source = get_broadcast(_ARRAY_INPUT)
+    get_broadcast(_ARRAY_OUTPUT)[start:stop] = fn(source[start:stop])
+
+
+def array_map(
+    fn: Callable[[Any], Any],
+    array: Any,
+    *,
+    out_shape: Optional[tuple[int, ...]] = None,
+    out_dtype: Any = None,
+    blocksize: Optional[int] = None,
+    pool: Type[ThreadPoolExecutor | ProcessPoolExecutor]
+    | Type["InterpreterPoolExecutor"]
+    | None = None,
+    max_workers: Optional[int] = None,
+    title: str | None = None,
+    subtitle: str | None = None,
+    remove_on_exit: bool = False,
+    disabled: bool = False,
+) -> Any:
+    """Apply `fn` to blocks of rows of a NumPy array and return the stacked output.
+
+    `fn` receives `array[start:stop]` and returns the matching rows of the output,
+    which has shape `out_shape` (default `array.shape`) and dtype `out_dtype`
+    (default `array.dtype`). In process and interpreter pools both arrays live
+    in `multiprocessing.shared_memory`: workers are sent only `(start, stop)`
+    pairs and write their results in place, so no array data is pickled. The
+    progress bar counts blocks of `blocksize` rows.
+
+    `pool` defaults to a process pool, or to threads on free-threaded Python,
+    with one worker per CPU core.
+    """
+    import numpy as np
+
+    if pool is None:
+        pool = _cpu_pool()
+        max_workers = max_workers or _cpu_count()
+    array = np.asarray(array)
+    out_shape = array.shape if out_shape is None else tuple(out_shape)
+    out_dtype = array.dtype if out_dtype is None else np.dtype(out_dtype)
+    if out_shape[:1] != array.shape[:1]:
+        raise ValueError("out_shape must match the length of array along axis 0")
+    n = len(array)
+    if blocksize is None:
+        # A few blocks per worker, so that uneven blocks still balance out.
+        workers = max_workers or _cpu_count()
+        blocksize = max(1, -(-n // (workers * 4)))
+    bounds = [(start, min(start + blocksize, n)) for start in range(0, n, blocksize)]
+
+    shared: list[_SharedArray] = []
+    try:
+        if _is_thread_pool(pool) or _runs_inline(pool):
+            # Nested maps run inline in this worker, where the arrays are at hand.
+            source, target = array, np.empty(out_shape, out_dtype)
+        else:
+            source = _SharedArray.from_array(array)
+            shared.append(source)
+            target = _SharedArray(out_shape, out_dtype, writeable=True)
+            shared.append(target)
+        concurrent_map(
+            pool,
+            partial(_array_block, fn),
+            bounds,
+            title=title,
+            subtitle=subtitle,
+            max_workers=max_workers,
+            remove_on_exit=remove_on_exit,
+            disabled=disabled,
+            ordered=False,
+            broadcast={_ARRAY_INPUT: source, _ARRAY_OUTPUT: target},
+        )
+        if isinstance(target, _SharedArray):
+            return target.view().copy()
+        return target
+    finally:
+        for segment in shared:
+            segment.release()
+
+
+# Chunk size of `map_reduce` over an iterable of unknown length.
+_REDUCE_CHUNKSIZE = 1024
+# Chunks per worker that `map_reduce` keeps in flight, bounding how far it reads
+# ahead in the iterable.
+_REDUCE_WINDOW = 4
+
+
+class _Fold:
+    """Maps `fn` over a chunk and folds the results with `reducer` in the worker."""
+
+    def __init__(self, fn: Callable[[Any], Any], reducer: Callable[[Any, Any], Any]):
+        self.fn = fn
+        self.reducer = reducer
+
+    def __call__(self, chunk: list[Any]) -> tuple[Any, int]:
+        return reduce(self.reducer, map(self.fn, chunk)), len(chunk)
+
+
+def _batches[T](iterable: Iterable[T], size: int) -> Iterator[list[T]]:
+    items = iter(iterable)
+    while batch := list(islice(items, size)):
+        yield batch
+
+
+class _TreeReducer:
+    """Merges values pairwise as they arrive, in order, like a balanced tree.
+
+    Only one pending value per tree level is kept, so `n` values take
+    O(log n) memory.
+    """
+
+    def __init__(self, reducer: Callable[[Any, Any], Any]):
+        self.reducer = reducer
+        self.levels: list[tuple[int, Any]] = []
+
+    def add(self, value: Any) -> None:
+        level = 0
+        while self.levels and self.levels[-1][0] == level:
+            value = self.reducer(self.levels.pop()[1], value)
+            level += 1
+        self.levels.append((level, value))
+
+    def result(self) -> Any:
+        _, value = self.levels[-1]
+        for _, earlier in reversed(self.levels[:-1]):
+            value = self.reducer(earlier, value)
+        return value
+
+
+def map_reduce[T, R](
+    fn: Callable[[T], R],
+    reducer: Callable[[R, R], R],
+    iterable: Iterable[T],
+    *,
+    initial: Any = _MISSING,
+    pool: Type[ThreadPoolExecutor | ProcessPoolExecutor]
+    | Type["InterpreterPoolExecutor"]
+    | Executor
+    | None = None,
+    chunksize: Optional[int] = None,
+    total: Optional[int] = None,
+    title: str | None = None,
+    subtitle: str | None = None,
+    max_workers: Optional[int] = None,
+    remove_on_exit: bool = False,
+    disabled: bool = False,
+    broadcast: Optional[Mapping[str, Any]] = None,
+) -> R:
+    """`functools.reduce(reducer, map(fn, iterable), initial)`, folded in the workers.
+
+    Each task maps `fn` over a chunk of items and folds the results with
+    `reducer` before returning, so only one partial result per chunk is sent
+    back instead of every item's result. The parent merges the partials
+    pairwise in input order as they arrive, so `reducer` must be associative
+    but need not be commutative (`operator.add` on numbers or lists,
+    `Counter.__add__`, ...). `initial`, if given, is folded in once, in front.
+
+    By default there are a few chunks per worker when the length is known, and
+    chunks of 1024 items otherwise. Only four chunks per worker are read ahead,
+    so generators far larger than memory can be reduced. `pool` defaults to a process pool, or to
+    threads on free-threaded Python, with one worker per CPU core. The
+    progress bar counts items.
+    """
+    if pool is None:
+        pool = _cpu_pool()
+        max_workers = max_workers or _cpu_count()
+    if total is None and isinstance(iterable, Sized):
+        total = len(iterable)
+    workers = max_workers or getattr(pool, "_max_workers", None) or _cpu_count()
+    if chunksize is None:
+        if total is None:
+            chunksize = _REDUCE_CHUNKSIZE
+        else:
+            # A few chunks per worker, so that uneven chunks still balance out.
+            chunksize = max(1, -(-total // (workers * 4)))
+    elif chunksize < 1:
+        raise ValueError("chunksize must be at least 1")
+
+    partials = _TreeReducer(reducer)
+    if initial is not _MISSING:
+        partials.add(initial)
+    with _progress(
+        iterable,
+        total,
+        title=title,
+        subtitle=subtitle,
+        remove_on_exit=remove_on_exit,
+        disabled=disabled or _in_worker(),
+    ) as advance:
+        for result, n in concurrent_imap(
+            pool,
+            _Fold(fn, reducer),
+            _batches(iterable, chunksize),
+            max_workers=max_workers,
+            disabled=True,
+            max_in_flight=_REDUCE_WINDOW * workers,
+            broadcast=broadcast,
+        ):
+            partials.add(result)
+            advance(n)
+    if not partials.levels:
+        raise TypeError("map_reduce() of empty iterable with no initial value")
+    return partials.result()
+
+
+class _Staged:
+    """Applies one pipeline stage to an `(index, item)` pair, keeping the index."""
+
+    def __init__(self, fn: Callable[[Any], Any]):
+        self.fn = fn
+
+    def __call__(self, pair: tuple[int, Any]) -> tuple[int, Any]:
+        index, item = pair
+        return index, self.fn(item)
+
+
+def _counted(
+    results: Iterator[tuple[int, tuple[int, Any]]], advance: Callable[[int], None]
+) -> Iterator[tuple[int, Any]]:
+    for _, pair in results:
+        advance(1)
+        yield pair
+
+
+def pipeline(
+    stages: Sequence[
+        tuple[
+            Callable[[Any], Any],
+            Type[ThreadPoolExecutor | ProcessPoolExecutor]
+            | Type["InterpreterPoolExecutor"]
+            | Executor,
+            Optional[int],
+        ]
+    ],
+    iterable: Iterable[Any],
+    *,
+    queue_size: Optional[int] = None,
+    ordered: bool = True,
+    total: Optional[int] = None,
+    title: str | None = None,
+    subtitle: str | None = None,
+    remove_on_exit: bool = False,
+    disabled: bool = False,
+) -> list[Any] | list[tuple[int, Any]]:
+    """Stream items through `(fn, pool, max_workers)` stages, each on its own pool.
+
+    Every stage runs its function on a pool of its own and passes results on
+    as soon as they are ready, so an I/O-bound stage on threads and a
+    CPU-bound stage on processes keep both kinds of workers busy at once. At
+    most `queue_size` items (twice the stage's workers by default) are in
+    flight in each stage; a stage pulls more from the one before it only as
+    its own results are taken, which bounds memory between stages.
+
+    Each stage gets its own progress bar, titled with the function name. With
+    `ordered=False`, `(index, result)` pairs are returned in completion order
+    instead of results in input order.
+    """
+    if not stages:
+        raise ValueError("pipeline needs at least one stage")
+    if total is None and isinstance(iterable, Sized):
+        total = len(iterable)
+    with ExitStack() as stack:
+        advances = []
+        for number, (fn, _, _) in enumerate(stages, 1):
+            name = getattr(fn, "__name__", f"stage {number}")
+            advances.append(
+                stack.enter_context(
+                    _progress(
+                        iterable,
+                        total,
+                        title=f"{title} · {name}" if title else name,
+                        subtitle=subtitle,
+                        remove_on_exit=remove_on_exit,
+                        disabled=disabled or _in_worker(),
+                    )
+                )
+            )
+        items: Iterator[tuple[int, Any]] = enumerate(iterable)
+        for (fn, pool, max_workers), advance in zip(stages, advances):
+            workers = max_workers or getattr(pool, "_max_workers", None) or _cpu_count()
+            results = concurrent_imap(
+                pool,
+                _Staged(fn),
+                items,
+                max_workers=max_workers,
+                disabled=True,
+                ordered=False,
+                max_in_flight=queue_size or 2 * workers,
+            )
+            items = _counted(stack.enter_context(closing(results)), advance)
+        if not ordered:
+            return list(items)
+        done = dict(items)
+    return [done[i] for i in range(len(done))]
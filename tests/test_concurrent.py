@@ -0,0 +1,1283 @@
+"""Tests for the concurrent mapping helpers."""
+
+import asyncio
+import collections
+import itertools
+import json
+import operator
+import os
+import subprocess
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+from moutils.concurrent import (
+    BackendReport,
+    MapStats,
+    ResultCache,
+    SpilledResults,
+    TaskError,
+    _ChunkSizer,
+    _Ticker,
+    _zip_iterables,
+    aprocess_map,
+    array_map,
+    async_map,
+    auto_map,
+    athread_map,
+    cancelled,
+    cpu_map,
+    get_broadcast,
+    get_pool,
+    gil_enabled,
+    map_reduce,
+    pipeline,
+    process_imap,
+    process_map,
+    process_starmap,
+    shutdown_pools,
+    thread_imap,
+    thread_map,
+    thread_starmap,
+)
+
+
+def _add_one(x):
+    return x + 1
+
+
+def _add_offset(x):
+    return x + get_broadcast("offset")
+
+
+def _row_sum(i):
+    return float(get_broadcast("table")[i].sum())
+
+
+def _double(block):
+    return block * 2
+
+
+def _row_sums(block):
+    return block.sum(axis=1)
+
+
+class _CountingPickles:
+    """Identity function that counts how often it is pickled in this process."""
+
+    pickled = 0
+
+    def __call__(self, x):
+        return x
+
+    def __reduce__(self):
+        type(self).pickled += 1
+        return (_CountingPickles, ())
+
+
+_calls = []
+
+
+def _recorded_square(x):
+    _calls.append(x)
+    return x * x
+
+
+_fail_on = set()
+
+
+def _flaky_square(x):
+    if x in _fail_on:
+        raise RuntimeError(f"failed on {x}")
+    _calls.append(x)
+    return x * x
+
+
+class _UnpicklableError(Exception):
+    def __init__(self, code, detail):
+        super().__init__(f"{code}: {detail}")
+
+
+def _raise_unpicklable(x):
+    raise _UnpicklableError(x, "bad")
+
+
+def _sleep_unless_first(x):
+    if x == 0:
+        time.sleep(0.1)
+        raise ValueError("first item failed")
+    time.sleep(30)
+    return x
+
+
+def _native_threads(_):
+    return os.environ.get("OMP_NUM_THREADS"), os.environ.get("OPENBLAS_NUM_THREADS")
+
+
+def _nested_sum(n):
+    idents = thread_map(lambda _: threading.get_ident(), range(n))
+    return len(set(idents)), threading.get_ident() in idents
+
+
+def _pid(_):
+    return os.getpid()
+
+
+def _sleep_briefly(x):
+    time.sleep(0.01)
+    return x
+
+
+def _sleep_a_while(x):
+    time.sleep(0.4)
+    return x
+
+
+def _sleep_tenth_ms(x):
+    time.sleep(0.0001)
+    return x
+
+
+def _hang_on_zero(x):
+    if x == 0:
+        time.sleep(60)
+    return x
+
+
+def _make_adder(n):
+    def add(x):
+        _calls.append(x)
+        return x + n
+
+    return add
+
+
+_initialized = threading.local()
+
+
+def _mark_initialized(value):
+    _initialized.value = value
+
+
+def _read_initialized(_):
+    return _initialized.value
+
+
+class TestThreadMap:
+    def test_preserves_order(self):
+        assert thread_map(_add_one, range(100)) == list(range(1, 101))
+
+    def test_unsized_iterable(self):
+        assert thread_map(_add_one, iter(range(10)), disabled=True) == list(
+            range(1, 11)
+        )
+
+    def test_empty(self):
+        assert thread_map(_add_one, []) == []
+
+
+class TestProcessMap:
+    def test_preserves_order(self):
+        assert process_map(abs, range(-5, 5), max_workers=2) == [
+            abs(x) for x in range(-5, 5)
+        ]
+
+
+class TestImap:
+    def test_thread_imap_is_lazy(self):
+        results = thread_imap(_add_one, range(10))
+        assert isinstance(results, types.GeneratorType)
+        assert list(results) == list(range(1, 11))
+
+    def test_thread_imap_early_close(self):
+        results = thread_imap(_add_one, range(100))
+        assert next(results) == 1
+        results.close()
+
+    def test_process_imap(self):
+        assert list(process_imap(abs, [-1, -2, 3], max_workers=2)) == [1, 2, 3]
+
+
+class TestUnordered:
+    def test_yields_index_result_pairs(self):
+        pairs = thread_map(_add_one, range(20), ordered=False)
+        assert sorted(pairs) == [(i, i + 1) for i in range(20)]
+
+    def test_completion_order(self):
+        release = threading.Event()
+
+        def slow_first(x):
+            if x == 0:
+                release.wait(5)
+            return x
+
+        pairs = thread_imap(slow_first, range(2), max_workers=2, ordered=False)
+        assert next(pairs) == (1, 1)
+        release.set()
+        assert list(pairs) == [(0, 0)]
+
+    def test_process_map_unordered(self):
+        pairs = process_map(abs, [-3, -2, -1], max_workers=2, ordered=False)
+        assert dict(pairs) == {0: 3, 1: 2, 2: 1}
+
+
+class TestScaling:
+    def _timed(self, map_fn, **kwargs):
+        start = time.perf_counter()
+        results = map_fn(_sleep_tenth_ms, range(20000), max_workers=4, **kwargs)
+        assert len(results) == 20000
+        return time.perf_counter() - start
+
+    def test_unordered_is_linear(self):
+        ordered = self._timed(thread_map)
+        assert self._timed(thread_map, ordered=False) < 2 * ordered + 0.5
+
+    def test_async_is_linear(self):
+        ordered = self._timed(thread_map)
+        assert self._timed(lambda *a, **k: asyncio.run(athread_map(*a, **k))) < (
+            2 * ordered + 0.5
+        )
+
+
+class TestMaxInFlight:
+    def test_bounded_window(self):
+        lock = threading.Lock()
+        running = 0
+        peak = 0
+
+        def track(x):
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            with lock:
+                running -= 1
+            return x
+
+        pulled = 0
+
+        def source():
+            nonlocal pulled
+            for i in range(50):
+                pulled += 1
+                yield i
+
+        results = thread_imap(track, source(), max_workers=8, max_in_flight=3)
+        assert next(results) == 0
+        assert pulled <= 4
+        assert list(results) == list(range(1, 50))
+        assert peak <= 3
+
+    def test_infinite_iterable(self):
+        results = thread_imap(_add_one, itertools.count(), max_in_flight=4)
+        assert list(itertools.islice(results, 5)) == [1, 2, 3, 4, 5]
+        results.close()
+
+    def test_unordered_with_window(self):
+        pairs = thread_map(_add_one, range(30), ordered=False, max_in_flight=2)
+        assert sorted(pairs) == [(i, i + 1) for i in range(30)]
+
+    def test_invalid_window(self):
+        with pytest.raises(ValueError):
+            thread_map(_add_one, range(3), max_in_flight=0)
+
+
+class TestChunksize:
+    @pytest.mark.parametrize("chunksize", [1, 3, 100, "auto"])
+    def test_thread_map(self, chunksize):
+        assert thread_map(_add_one, range(50), chunksize=chunksize) == list(
+            range(1, 51)
+        )
+
+    def test_process_map_chunked(self):
+        assert process_map(abs, range(-50, 50), max_workers=2, chunksize=7) == [
+            abs(x) for x in range(-50, 50)
+        ]
+
+    def test_unordered_chunked(self):
+        pairs = thread_map(_add_one, range(25), ordered=False, chunksize=4)
+        assert sorted(pairs) == [(i, i + 1) for i in range(25)]
+
+    def test_invalid_chunksize(self):
+        with pytest.raises(ValueError):
+            thread_map(_add_one, range(3), chunksize=0)
+
+    def test_auto_batches_cheap_items(self):
+        submitted = []
+
+        class CountingPool(ThreadPoolExecutor):
+            def submit(self, fn, /, *args, **kwargs):
+                submitted.append(fn)
+                return super().submit(fn, *args, **kwargs)
+
+        with CountingPool(max_workers=2) as pool:
+            results = thread_map(_add_one, range(20000), chunksize="auto", pool=pool)
+        assert results == list(range(1, 20001))
+        assert len(submitted) < 50
+
+    def test_auto_shrinks_for_slow_items(self):
+        sizer = _ChunkSizer("auto")
+        sizer.observe(1, 1e-6)
+        assert sizer.size > 1
+        for _ in range(10):
+            sizer.observe(sizer.size, sizer.size * 1.0)
+        assert sizer.size == 1
+
+
+class TestPools:
+    def teardown_method(self):
+        shutdown_pools()
+
+    def test_get_pool_is_shared(self):
+        a = get_pool(ThreadPoolExecutor, max_workers=2)
+        assert get_pool(ThreadPoolExecutor, max_workers=2) is a
+        assert get_pool(ThreadPoolExecutor, max_workers=3) is not a
+
+    def test_pool_argument_keeps_pool_running(self):
+        pool = get_pool(ThreadPoolExecutor, max_workers=2)
+        assert thread_map(_add_one, range(5), pool=pool) == [1, 2, 3, 4, 5]
+        assert pool.submit(_add_one, 1).result() == 2
+
+    def test_user_pool_is_not_shut_down(self):
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            assert thread_map(_add_one, range(3), pool=pool) == [1, 2, 3]
+            assert pool.submit(_add_one, 1).result() == 2
+
+    def test_persistent_reuses_threads(self):
+        def thread_name(_):
+            return threading.current_thread().name
+
+        first = set(thread_map(thread_name, range(20), max_workers=2, persistent=True))
+        second = set(thread_map(thread_name, range(20), max_workers=2, persistent=True))
+        assert len(first | second) <= 2
+
+    def test_idle_timeout_replaces_expired_pool(self):
+        pool = get_pool(ThreadPoolExecutor, max_workers=1, idle_timeout=0.01)
+        time.sleep(0.2)
+        with pytest.raises(RuntimeError):
+            pool.submit(_add_one, 1)
+        assert thread_map(_add_one, range(3), pool=pool) == [1, 2, 3]
+
+
+class TestBroadcast:
+    def test_thread_map(self):
+        assert thread_map(_add_offset, range(3), broadcast={"offset": 10}) == [
+            10,
+            11,
+            12,
+        ]
+
+    def test_process_map(self):
+        assert process_map(
+            _add_offset, range(3), max_workers=2, broadcast={"offset": 10}
+        ) == [10, 11, 12]
+
+    def test_process_map_shares_numpy_arrays(self):
+        np = pytest.importorskip("numpy")
+        table = np.arange(12, dtype=np.float64).reshape(4, 3)
+        results = process_map(
+            _row_sum, range(4), max_workers=2, broadcast={"table": table}
+        )
+        assert results == [float(row.sum()) for row in table]
+
+    def test_missing_name(self):
+        with pytest.raises(KeyError):
+            thread_map(_add_offset, range(3))
+
+    def test_rejected_for_running_pool(self):
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            with pytest.raises(ValueError):
+                thread_map(_add_offset, range(3), pool=pool, broadcast={"offset": 1})
+
+    def test_initializer(self):
+        results = thread_map(
+            _read_initialized,
+            range(4),
+            max_workers=2,
+            initializer=_mark_initialized,
+            initargs=("ready",),
+        )
+        assert results == ["ready"] * 4
+
+
+class TestArrayMap:
+    def test_process_pool(self):
+        np = pytest.importorskip("numpy")
+        array = np.arange(100, dtype=np.int64).reshape(50, 2)
+        result = array_map(_double, array, max_workers=2, blocksize=7)
+        np.testing.assert_array_equal(result, array * 2)
+
+    def test_thread_pool(self):
+        np = pytest.importorskip("numpy")
+        array = np.arange(100, dtype=np.int64).reshape(50, 2)
+        result = array_map(_double, array, pool=ThreadPoolExecutor, max_workers=2)
+        np.testing.assert_array_equal(result, array * 2)
+
+    def test_out_shape_and_dtype(self):
+        np = pytest.importorskip("numpy")
+        array = np.ones((20, 3), dtype=np.int32)
+        result = array_map(
+            _row_sums, array, out_shape=(20,), out_dtype=np.float64, max_workers=2
+        )
+        assert result.dtype == np.float64
+        np.testing.assert_array_equal(result, np.full(20, 3.0))
+
+    def test_mismatched_out_shape(self):
+        np = pytest.importorskip("numpy")
+        with pytest.raises(ValueError):
+            array_map(_double, np.zeros((4, 2)), out_shape=(3, 2))
+
+
+class TestFunctionShipping:
+    def test_process_map_ships_fn_once_per_worker(self):
+        _CountingPickles.pickled = 0
+        assert process_map(_CountingPickles(), range(20), max_workers=2) == list(
+            range(20)
+        )
+        assert _CountingPickles.pickled <= 2
+
+    def test_running_pool_ships_fn_per_task(self):
+        _CountingPickles.pickled = 0
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            process_map(_CountingPickles(), range(20), pool=pool)
+        assert _CountingPickles.pickled == 20
+
+
+class TestAsyncMap:
+    def test_athread_map(self):
+        assert asyncio.run(athread_map(_add_one, range(20), chunksize=3)) == list(
+            range(1, 21)
+        )
+
+    def test_aprocess_map(self):
+        results = asyncio.run(aprocess_map(abs, [-1, -2, 3], max_workers=2))
+        assert results == [1, 2, 3]
+
+    def test_unordered(self):
+        pairs = asyncio.run(athread_map(_add_one, range(10), ordered=False))
+        assert sorted(pairs) == [(i, i + 1) for i in range(10)]
+
+    def test_event_loop_stays_responsive(self):
+        def slow(x):
+            time.sleep(0.05)
+            return x
+
+        async def main():
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0.01)
+
+            task = asyncio.create_task(ticker())
+            results = await athread_map(slow, range(8), max_workers=2)
+            task.cancel()
+            return results, ticks
+
+        results, ticks = asyncio.run(main())
+        assert results == list(range(8))
+        assert ticks > 5
+
+
+class TestAsyncCoroutineMap:
+    def test_preserves_order(self):
+        async def add_one(x):
+            await asyncio.sleep(0.001 * (10 - x))
+            return x + 1
+
+        assert asyncio.run(async_map(add_one, range(10))) == list(range(1, 11))
+
+    def test_concurrency_limit(self):
+        running = 0
+        peak = 0
+
+        async def track(x):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.001)
+            running -= 1
+            return x
+
+        results = asyncio.run(async_map(track, range(50), concurrency=4))
+        assert results == list(range(50))
+        assert peak == 4
+
+    def test_unordered(self):
+        async def identity(x):
+            return x
+
+        pairs = asyncio.run(async_map(identity, iter(range(5)), ordered=False))
+        assert sorted(pairs) == [(i, i) for i in range(5)]
+
+    def test_error_cancels_pending(self):
+        cancelled = 0
+
+        async def fail_first(x):
+            nonlocal cancelled
+            if x == 0:
+                raise RuntimeError("boom")
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled += 1
+                raise
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(async_map(fail_first, range(5), concurrency=5))
+        assert cancelled == 4
+
+
+def _run_script(script, seed):
+    """Run `script` in a fresh interpreter with the given hash seed; return stdout."""
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(sys.path),
+        "PYTHONHASHSEED": str(seed),
+    }
+    return subprocess.run(
+        [sys.executable, "-c", script],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.strip()
+
+
+class TestResultCache:
+    def setup_method(self):
+        _calls.clear()
+
+    def test_rerun_skips_cached_items(self, tmp_path):
+        assert thread_map(_recorded_square, range(5), cache=tmp_path) == [
+            0,
+            1,
+            4,
+            9,
+            16,
+        ]
+        assert sorted(_calls) == [0, 1, 2, 3, 4]
+        _calls.clear()
+        assert thread_map(_recorded_square, range(7), cache=tmp_path) == [
+            0,
+            1,
+            4,
+            9,
+            16,
+            25,
+            36,
+        ]
+        assert sorted(_calls) == [5, 6]
+
+    def test_closure_change_invalidates(self, tmp_path):
+        assert thread_map(_make_adder(1), range(3), cache=tmp_path) == [1, 2, 3]
+        _calls.clear()
+        assert thread_map(_make_adder(10), range(3), cache=tmp_path) == [10, 11, 12]
+        assert sorted(_calls) == [0, 1, 2]
+
+    def test_chunked_and_unordered(self, tmp_path):
+        thread_map(_recorded_square, range(0, 20, 2), cache=tmp_path)
+        _calls.clear()
+        pairs = thread_map(
+            _recorded_square, range(20), cache=tmp_path, chunksize=3, ordered=False
+        )
+        assert sorted(pairs) == [(i, i * i) for i in range(20)]
+        assert sorted(_calls) == list(range(1, 20, 2))
+
+    def test_chunked_ordered_with_partial_cache(self, tmp_path):
+        thread_map(_recorded_square, [1, 3], cache=tmp_path)
+        _calls.clear()
+        results = thread_map(_recorded_square, range(6), cache=tmp_path, chunksize=4)
+        assert results == [0, 1, 4, 9, 16, 25]
+        assert sorted(_calls) == [0, 2, 4, 5]
+
+    def test_keys_are_stable_across_interpreters(self):
+        script = """
+from moutils.concurrent import _fingerprint, _item_key
+
+def f(x, names={"x", "y", "z"}):
+    return x in {"a", "b", "c", "d", "e"}
+
+print(_item_key(_fingerprint(f), [frozenset({"p", "q", "r"}), {"k": {"u", "v"}}]))
+"""
+        assert len({_run_script(script, seed) for seed in range(4)}) == 1
+
+    def test_process_map(self, tmp_path):
+        cache = ResultCache(tmp_path)
+        assert process_map(abs, [-1, -2], max_workers=2, cache=cache) == [1, 2]
+        assert process_map(abs, [-1, -2], max_workers=2, cache=cache) == [1, 2]
+        assert len(list(tmp_path.glob("*/*.pkl"))) == 2
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        cache = ResultCache(tmp_path, max_size=0)
+        for i in range(3):
+            cache.put(str(i) * 8, b"x" * 100)
+            time.sleep(0.01)
+        entry_size = cache._path("0" * 8).stat().st_size
+        cache.max_size = 2 * entry_size
+        cache.get("0" * 8)
+        cache.evict()
+        remaining = sorted(path.stem for path in tmp_path.glob("*/*.pkl"))
+        assert remaining == ["0" * 8, "2" * 8]
+
+
+class TestCheckpoint:
+    def setup_method(self):
+        _calls.clear()
+        _fail_on.clear()
+
+    def test_resume_after_failure(self, tmp_path):
+        journal = tmp_path / "run.ckpt"
+        _fail_on.add(5)
+        with pytest.raises(RuntimeError):
+            thread_map(
+                _flaky_square,
+                range(10),
+                max_workers=1,
+                max_in_flight=1,
+                checkpoint=journal,
+            )
+        assert _calls == [0, 1, 2, 3, 4]
+        _calls.clear()
+        _fail_on.clear()
+        results = thread_map(_flaky_square, range(10), checkpoint=journal)
+        assert results == [x * x for x in range(10)]
+        assert sorted(_calls) == [5, 6, 7, 8, 9]
+
+    def test_chunked_resume_keeps_order(self, tmp_path):
+        journal = tmp_path / "run.ckpt"
+        _fail_on.add(0)
+        thread_map(_flaky_square, range(4), checkpoint=journal, on_error="collect")
+        _fail_on.clear()
+        _calls.clear()
+        results = thread_map(_flaky_square, range(4), checkpoint=journal, chunksize=4)
+        assert results == [0, 1, 4, 9]
+        assert _calls == [0]
+
+    def test_resume_in_new_interpreter(self, tmp_path):
+        script = f"""
+from moutils.concurrent import thread_map
+
+calls = []
+
+def vowel(x):
+    calls.append(x)
+    return x in {{"a", "e", "i", "o", "u"}}
+
+thread_map(vowel, list("abcdefgh"), checkpoint={str(tmp_path / "run.ckpt")!r})
+print(len(calls))
+"""
+        assert _run_script(script, 1) == "8"
+        assert _run_script(script, 2) == "0"
+
+    def test_changed_inputs_are_recomputed(self, tmp_path):
+        journal = tmp_path / "run.ckpt"
+        thread_map(_flaky_square, [1, 2, 3], checkpoint=journal)
+        _calls.clear()
+        assert thread_map(_flaky_square, [1, 5, 3], checkpoint=journal) == [1, 25, 9]
+        assert _calls == [5]
+
+    def test_torn_record_is_ignored(self, tmp_path):
+        journal = tmp_path / "run.ckpt"
+        thread_map(_flaky_square, range(3), checkpoint=journal)
+        with open(journal, "ab") as f:
+            f.write(b"\x80\x05garbage")
+        _calls.clear()
+        assert thread_map(_flaky_square, range(4), checkpoint=journal) == [0, 1, 4, 9]
+        assert _calls == [3]
+        _calls.clear()
+        thread_map(_flaky_square, range(4), checkpoint=journal)
+        assert _calls == []
+
+
+class TestCancellation:
+    def test_thread_map_does_not_drain_queue(self):
+        def slow(x):
+            if x == 0:
+                raise ValueError("boom")
+            time.sleep(0.2)
+            return x
+
+        start = time.perf_counter()
+        with pytest.raises(ValueError):
+            thread_map(slow, range(100), max_workers=2)
+        assert time.perf_counter() - start < 2
+
+    def test_process_map_terminates_running_workers(self):
+        start = time.perf_counter()
+        with pytest.raises(ValueError):
+            process_map(_sleep_unless_first, range(10), max_workers=2)
+        assert time.perf_counter() - start < 10
+
+    def test_cooperative_cancellation(self):
+        stopped = threading.Event()
+
+        def work(x):
+            if x == 0:
+                time.sleep(0.05)
+                raise ValueError("boom")
+            while not cancelled():
+                time.sleep(0.01)
+            stopped.set()
+
+        with pytest.raises(ValueError):
+            thread_map(work, range(2), max_workers=2)
+        assert stopped.wait(2)
+
+    def test_not_cancelled_outside_map(self):
+        assert cancelled() is False
+
+
+class TestErrors:
+    def setup_method(self):
+        _calls.clear()
+        _fail_on.clear()
+
+    def test_collect(self):
+        _fail_on.update({2, 4})
+        results = thread_map(_flaky_square, range(6), on_error="collect")
+        assert [r for r in results if not isinstance(r, TaskError)] == [0, 1, 9, 25]
+        errors = [r for r in results if isinstance(r, TaskError)]
+        assert [(e.index, e.item, e.attempts) for e in errors] == [(2, 2, 1), (4, 4, 1)]
+        assert isinstance(errors[0].exception, RuntimeError)
+        assert "failed on 2" in errors[0].traceback
+
+    def test_collect_chunked_process_map(self):
+        results = process_map(
+            _raise_unpicklable, range(4), chunksize=2, on_error="collect"
+        )
+        assert [e.index for e in results] == [0, 1, 2, 3]
+        assert "_UnpicklableError" in str(results[0].exception)
+
+    def test_retry_recovers(self):
+        attempts = {}
+
+        def flaky(x):
+            attempts[x] = attempts.get(x, 0) + 1
+            if attempts[x] < 3:
+                raise OSError("transient")
+            return x
+
+        results = thread_map(
+            flaky, range(4), max_workers=1, on_error="retry", backoff=0.001
+        )
+        assert results == [0, 1, 2, 3]
+        assert set(attempts.values()) == {3}
+
+    def test_retry_gives_up(self):
+        def fail(x):
+            raise OSError("down")
+
+        (error,) = thread_map(fail, [0], on_error="retry", retries=2, backoff=0.001)
+        assert error.attempts == 3
+
+    def test_only_retry_on_listed_exceptions(self):
+        def fail(x):
+            raise KeyError(x)
+
+        (error,) = thread_map(
+            fail, [0], on_error="retry", retry_on=(OSError,), backoff=0.001
+        )
+        assert error.attempts == 1
+
+    def test_failures_are_not_checkpointed(self, tmp_path):
+        journal = tmp_path / "run.ckpt"
+        _fail_on.add(1)
+        thread_map(_flaky_square, range(3), on_error="collect", checkpoint=journal)
+        _fail_on.clear()
+        _calls.clear()
+        assert thread_map(_flaky_square, range(3), checkpoint=journal) == [0, 1, 4]
+        assert _calls == [1]
+
+    def test_invalid_on_error(self):
+        with pytest.raises(ValueError):
+            thread_map(_add_one, range(3), on_error="ignore")
+
+
+class TestStragglers:
+    def test_process_task_timeout_collects(self):
+        start = time.perf_counter()
+        results = process_map(
+            _hang_on_zero,
+            range(6),
+            max_workers=2,
+            task_timeout=1,
+            on_error="collect",
+        )
+        assert time.perf_counter() - start < 20
+        assert isinstance(results[0], TaskError)
+        assert isinstance(results[0].exception, TimeoutError)
+        assert results[0].index == 0
+        assert results[1:] == [1, 2, 3, 4, 5]
+
+    def test_queued_items_do_not_use_up_task_timeout(self):
+        results = process_map(
+            _sleep_a_while,
+            range(4),
+            max_workers=1,
+            task_timeout=0.7,
+            on_error="collect",
+        )
+        assert results == [0, 1, 2, 3]
+
+    def test_process_task_timeout_raises(self):
+        start = time.perf_counter()
+        with pytest.raises(TimeoutError):
+            process_map(_hang_on_zero, range(4), max_workers=2, task_timeout=0.5)
+        assert time.perf_counter() - start < 20
+
+    def test_thread_task_timeout_does_not_wait(self):
+        release = threading.Event()
+
+        def work(x):
+            if x == 0:
+                release.wait(30)
+            return x
+
+        start = time.perf_counter()
+        try:
+            results = thread_map(
+                work, range(4), task_timeout=0.2, on_error="collect", ordered=False
+            )
+        finally:
+            release.set()
+        assert time.perf_counter() - start < 5
+        errors = [r for _, r in results if isinstance(r, TaskError)]
+        assert [e.index for e in errors] == [0]
+        assert sorted(r for _, r in results if r not in errors) == [1, 2, 3]
+
+    def test_speculate_takes_first_copy(self):
+        release = threading.Event()
+        calls = itertools.count()
+
+        def work(x):
+            if x == 0 and next(calls) == 0:
+                release.wait(30)
+                return -1
+            return x
+
+        start = time.perf_counter()
+        try:
+            results = thread_map(work, range(4), max_workers=2, speculate=True)
+        finally:
+            release.set()
+        assert results == [0, 1, 2, 3]
+        assert time.perf_counter() - start < 5
+
+    def test_task_timeout_validation(self):
+        with pytest.raises(ValueError):
+            thread_map(_add_one, range(3), task_timeout=1, chunksize=2)
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            with pytest.raises(ValueError):
+                process_map(_add_one, range(3), pool=pool, task_timeout=1)
+
+
+class TestStats:
+    def test_thread_map_records_tasks(self):
+        stats = MapStats()
+        assert thread_map(_add_one, range(20), max_workers=2, stats=stats) == list(
+            range(1, 21)
+        )
+        assert sorted(task.index for task in stats.tasks) == list(range(20))
+        assert all(task.result_bytes is None for task in stats.tasks)
+        assert all(task.queue_wait >= 0 and task.run_time >= 0 for task in stats.tasks)
+        summary = stats.summary()
+        assert summary["items"] == 20
+        assert summary["throughput"] > 0
+        assert set(summary["run_time"]) == {"p50", "p95", "p99"}
+        assert 0 <= summary["utilization"] <= 1
+
+    def test_process_map_records_result_size(self):
+        stats = MapStats()
+        process_map(_add_one, range(6), chunksize=2, stats=stats)
+        assert len(stats.tasks) == 6
+        assert all(task.result_bytes > 0 for task in stats.tasks)
+        assert len({task.worker for task in stats.tasks}) <= stats.workers
+
+    def test_chrome_trace(self, tmp_path):
+        stats = MapStats()
+        thread_map(_add_one, range(5), stats=stats)
+        path = tmp_path / "trace.json"
+        stats.to_chrome_trace(path)
+        events = json.loads(path.read_text())["traceEvents"]
+        assert len(events) == 5
+        assert {event["ph"] for event in events} == {"X"}
+
+    def test_cached_items_are_counted(self, tmp_path):
+        thread_map(_add_one, range(4), cache=tmp_path)
+        stats = MapStats()
+        thread_map(_add_one, range(6), cache=tmp_path, stats=stats)
+        assert stats.cached == 4
+        assert len(stats.tasks) == 2
+
+
+class TestProgress:
+    def test_updates_are_batched(self):
+        updates = []
+        ticker = _Ticker(lambda n, text: updates.append((n, text)), 1000, None)
+        for _ in range(1000):
+            ticker(1)
+        ticker.flush(time.monotonic())
+        assert len(updates) < 10
+        assert sum(n for n, _ in updates) == 1000
+
+    def test_subtitle_shows_rate_and_eta(self):
+        updates = []
+        ticker = _Ticker(lambda n, text: updates.append(text), 100, "Fetching")
+        ticker.started -= 10
+        ticker.next_update -= 10
+        ticker(50)
+        assert updates == ["Fetching · 5 items/s · ETA 10s"]
+
+    def test_unknown_total_shows_count(self):
+        updates = []
+        ticker = _Ticker(lambda n, text: updates.append(text), None, None)
+        ticker.started -= 2
+        ticker.next_update -= 2
+        ticker(4000)
+        assert updates == ["4,000 items · 2,000 items/s"]
+
+    def test_map_with_progress_bar(self):
+        assert thread_map(_add_one, range(100), title="Adding") == list(range(1, 101))
+        assert list(thread_imap(_add_one, iter(range(5)))) == [1, 2, 3, 4, 5]
+
+
+class TestAutoMap:
+    def test_runs_everything_on_the_fastest_backend(self):
+        report = BackendReport()
+        assert auto_map(
+            _sleep_briefly, range(30), max_workers=4, report=report
+        ) == list(range(30))
+        assert report.backend in report.seconds_per_item
+        assert {"threads", "processes"} <= set(report.seconds_per_item)
+        assert report.speedups[report.backend] > 1
+
+    def test_unpicklable_function_uses_threads(self):
+        report = BackendReport()
+        assert auto_map(lambda x: x * 2, range(10), report=report) == [
+            x * 2 for x in range(10)
+        ]
+        assert report.backend == "threads"
+        assert "processes" in report.skipped
+
+    def test_fewer_items_than_sample(self):
+        assert auto_map(_add_one, iter(range(3)), sample_size=8) == [1, 2, 3]
+        assert auto_map(_add_one, []) == []
+
+
+class TestFreeThreading:
+    def test_gil_enabled(self, monkeypatch):
+        assert isinstance(gil_enabled(), bool)
+        monkeypatch.setattr(sys, "_is_gil_enabled", lambda: False, raising=False)
+        assert gil_enabled() is False
+
+    def test_cpu_map_uses_threads_without_gil(self, monkeypatch):
+        monkeypatch.setattr(sys, "_is_gil_enabled", lambda: False, raising=False)
+        assert set(cpu_map(_pid, range(8))) == {os.getpid()}
+
+    def test_cpu_map_uses_processes_with_gil(self, monkeypatch):
+        monkeypatch.setattr(sys, "_is_gil_enabled", lambda: True, raising=False)
+        assert os.getpid() not in cpu_map(_pid, range(8), max_workers=2)
+
+
+class TestNesting:
+    def test_native_threads_auto(self):
+        expected = str(max(1, (os.cpu_count() or 1) // 2))
+        assert (
+            process_map(_native_threads, range(2), max_workers=2)
+            == [(expected, expected)] * 2
+        )
+
+    def test_native_threads_explicit(self):
+        assert process_map(
+            _native_threads, range(1), max_workers=1, native_threads=3
+        ) == [("3", "3")]
+
+    def test_native_threads_disabled(self, monkeypatch):
+        monkeypatch.delenv("OMP_NUM_THREADS", raising=False)
+        monkeypatch.delenv("OPENBLAS_NUM_THREADS", raising=False)
+        assert process_map(
+            _native_threads, range(1), max_workers=1, native_threads=None
+        ) == [(None, None)]
+
+    def test_thread_pools_leave_environment_alone(self, monkeypatch):
+        monkeypatch.delenv("OMP_NUM_THREADS", raising=False)
+        thread_map(_add_one, range(2), broadcast={"x": 1})
+        assert "OMP_NUM_THREADS" not in os.environ
+
+    def test_nested_map_runs_inline_in_threads(self):
+        assert thread_map(_nested_sum, [5, 5], max_workers=2) == [(1, True)] * 2
+
+    def test_nested_map_runs_inline_in_processes(self):
+        assert process_map(_nested_sum, [5, 5], max_workers=2) == [(1, True)] * 2
+
+    def test_process_map_in_thread_worker_uses_processes(self):
+        def outer(x):
+            return process_map(_pid, range(2), max_workers=2)
+
+        for pids in thread_map(outer, range(2), max_workers=2):
+            assert os.getpid() not in pids
+
+    def test_nested_broadcast(self):
+        def outer(x):
+            return thread_map(_add_offset, [x], broadcast={"offset": 10})[0]
+
+        assert thread_map(outer, range(3), broadcast={"offset": 1}) == [10, 11, 12]
+
+    def test_cancelled_survives_nested_map(self):
+        def outer(x):
+            thread_map(_add_one, range(3))
+            return cancelled()
+
+        assert thread_map(outer, range(2)) == [False, False]
+
+
+class TestCost:
+    def setup_method(self):
+        _calls.clear()
+
+    def test_most_expensive_first_in_input_order(self):
+        items = [3, 1, 4, 1, 5, 9, 2, 6]
+        results = thread_map(_recorded_square, items, max_workers=1, cost=lambda x: x)
+        assert results == [x * x for x in items]
+        assert _calls == sorted(items, reverse=True)
+
+    def test_unordered_keeps_indices(self):
+        items = [3, 1, 4, 1, 5]
+        pairs = thread_map(_add_one, items, ordered=False, cost=lambda x: -x)
+        assert sorted(pairs) == [(i, x + 1) for i, x in enumerate(items)]
+
+    def test_process_map_with_cost(self):
+        items = list(range(10))
+        assert process_map(_add_one, items, chunksize=3, cost=float) == [
+            x + 1 for x in items
+        ]
+
+    def test_many_items_with_cost(self):
+        items = list(range(5000))
+        start = time.perf_counter()
+        results = thread_map(_sleep_tenth_ms, items, max_workers=4, cost=float)
+        assert results == items
+        assert time.perf_counter() - start < 10
+
+    def test_async_with_cost(self):
+        items = [2, 7, 1, 8]
+        results = asyncio.run(athread_map(_add_one, items, cost=lambda x: x))
+        assert results == [x + 1 for x in items]
+
+
+class TestStarmap:
+    def test_multiple_iterables_stop_at_shortest(self):
+        assert thread_map(pow, [2, 3, 4], [5, 2, 1, 0]) == [32, 9, 4]
+
+    def test_multiple_iterables_in_processes(self):
+        assert process_map(pow, range(6), itertools.repeat(2), chunksize=4) == [
+            x**2 for x in range(6)
+        ]
+
+    def test_thread_starmap(self):
+        assert thread_starmap(pow, [(2, 5), (3, 2), (4, 1)]) == [32, 9, 4]
+
+    def test_process_starmap_chunked(self):
+        pairs = [(x, 3) for x in range(10)]
+        assert process_starmap(pow, pairs, chunksize="auto") == [
+            x**3 for x in range(10)
+        ]
+
+    def test_imap_with_multiple_iterables(self):
+        assert list(thread_imap(pow, [2, 3], [1, 2])) == [2, 9]
+
+    def test_collected_error_keeps_arguments(self):
+        results = thread_starmap(divmod, [(4, 2), (1, 0)], on_error="collect")
+        assert results[0] == (2, 0)
+        assert isinstance(results[1], TaskError)
+        assert results[1].item == (1, 0)
+
+    def test_sized_iterables_give_progress_total(self):
+        combined, star = _zip_iterables([1, 2, 3], ("ab",), False)
+        assert star
+        assert len(combined) == 2
+        assert list(combined) == [(1, "a"), (2, "b")]
+
+    def test_unsized_iterables_have_no_total(self):
+        combined, _ = _zip_iterables([1, 2], (iter([3, 4]),), False)
+        assert not hasattr(combined, "__len__")
+
+    def test_iterable_by_keyword(self):
+        assert thread_map(abs, iterable=[-1, 2]) == [1, 2]
+        assert list(process_imap(abs, iterable=[-3])) == [3]
+
+    def test_requires_an_iterable(self):
+        with pytest.raises(TypeError):
+            thread_map(_add_one)
+
+    def test_async_multiple_iterables(self):
+        assert asyncio.run(athread_map(pow, [2, 3], [3, 2])) == [8, 9]
+
+
+class TestMapReduce:
+    def test_sum_in_processes(self):
+        assert map_reduce(_add_one, operator.add, range(100), max_workers=2) == 5050
+
+    def test_keeps_order_for_non_commutative_reducer(self):
+        result = map_reduce(
+            lambda x: [x], operator.add, range(50), pool=ThreadPoolExecutor, chunksize=3
+        )
+        assert result == list(range(50))
+
+    def test_initial_is_folded_in_once(self):
+        result = map_reduce(
+            _add_one, operator.add, iter(range(10)), initial=100, chunksize=2
+        )
+        assert result == 155
+
+    def test_counters(self):
+        lines = ["a b", "b c", "c c"] * 10
+        counts = map_reduce(
+            lambda line: collections.Counter(line.split()),
+            operator.add,
+            lines,
+            pool=ThreadPoolExecutor,
+            initial=collections.Counter(),
+        )
+        assert counts == {"a": 10, "b": 20, "c": 30}
+
+    def test_empty(self):
+        assert map_reduce(_add_one, operator.add, [], initial=0) == 0
+        with pytest.raises(TypeError):
+            map_reduce(_add_one, operator.add, [])
+
+    def test_reads_ahead_a_bounded_window(self):
+        pulled = []
+        done = []
+        lead = []
+
+        def items():
+            for i in range(100_000):
+                pulled.append(i)
+                yield i
+
+        def square(x):
+            done.append(x)
+            lead.append(len(pulled) - len(done))
+            return x * x
+
+        result = map_reduce(
+            square,
+            operator.add,
+            items(),
+            pool=ThreadPoolExecutor,
+            max_workers=2,
+            chunksize=100,
+        )
+        assert result == sum(x * x for x in range(100_000))
+        assert max(lead) < 5000
+
+    def test_tree_order_with_many_partials(self):
+        result = map_reduce(
+            lambda x: [x],
+            operator.add,
+            iter(range(1000)),
+            pool=ThreadPoolExecutor,
+            chunksize=7,
+            initial=[-1],
+        )
+        assert result == list(range(-1, 1000))
+
+    def test_one_result_per_chunk(self):
+        calls = []
+
+        def reducer(a, b):
+            calls.append(threading.current_thread() is threading.main_thread())
+            return a + b
+
+        map_reduce(_add_one, reducer, range(40), pool=ThreadPoolExecutor, chunksize=10)
+        # 9 folds of 10 items in each of the 4 chunks; 3 merges of the partials.
+        assert calls.count(True) == 3
+        assert calls.count(False) == 36
+
+
+class TestSpilledResults:
+    def test_spills_past_threshold(self):
+        with SpilledResults(spill_after=200) as results:
+            results.extend(range(100))
+            assert 0 < results.spilled < 100
+            assert len(results) == 100
+            assert list(results) == list(range(100))
+            assert results[0] == 0
+            assert results[-1] == 99
+            assert results[10:15] == [10, 11, 12, 13, 14]
+            with pytest.raises(IndexError):
+                results[100]
+
+    def test_reads_while_appending(self):
+        with SpilledResults(spill_after=0) as results:
+            for i in range(5):
+                results.append({"i": i})
+                assert results[i] == {"i": i}
+            assert results.spilled == 5
+
+    def test_process_map_spill(self):
+        results = process_map(_add_one, range(50), spill_after=64, chunksize=10)
+        assert isinstance(results, SpilledResults)
+        assert results.spilled > 0
+        assert list(results) == [x + 1 for x in range(50)]
+        results.close()
+        assert len(results) == 0
+
+    def test_unordered_spill(self):
+        results = thread_map(_add_one, range(20), ordered=False, spill_after=0)
+        assert sorted(results) == [(i, i + 1) for i in range(20)]
+        results.close()
+
+
+class TestPipeline:
+    def test_threads_then_processes(self):
+        stages = [(_add_one, ThreadPoolExecutor, 4), (abs, ProcessPoolExecutor, 2)]
+        assert pipeline(stages, range(-10, 10)) == [abs(x + 1) for x in range(-10, 10)]
+
+    def test_unordered_pairs(self):
+        stages = [(_add_one, ThreadPoolExecutor, 2), (_add_one, ThreadPoolExecutor, 2)]
+        pairs = pipeline(stages, iter(range(20)), ordered=False)
+        assert sorted(pairs) == [(i, i + 2) for i in range(20)]
+
+    def test_queues_are_bounded(self):
+        read, parsed, overrun = [], [], []
+
+        def fast(x):
+            read.append(x)
+            return x
+
+        def slow(x):
+            if len(read) > len(parsed) + 6:
+                overrun.append(x)
+            time.sleep(0.01)
+            parsed.append(x)
+            return x
+
+        stages = [(fast, ThreadPoolExecutor, 2), (slow, ThreadPoolExecutor, 1)]
+        assert pipeline(stages, range(40), queue_size=2) == list(range(40))
+        assert not overrun
+
+    def test_stage_error_propagates(self):
+        def fail_on_three(x):
+            if x == 3:
+                raise ValueError("three")
+            return x
+
+        stages = [
+            (_add_one, ThreadPoolExecutor, 2),
+            (fail_on_three, ThreadPoolExecutor, 2),
+        ]
+        with pytest.raises(ValueError, match="three"):
+            pipeline(stages, range(10))
+
+    def test_needs_a_stage(self):
+        with pytest.raises(ValueError):
+            pipeline([], range(3))